@@ -1,80 +1,597 @@
 import os
-import uuid
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
-from flask_sqlalchemy import SQLAlchemy
+import io
+import re
+import sys
+import time
+import queue
+import csv
+import json
+import math
+import hashlib
+import hmac
+import shutil
+import tempfile
+import threading
+import zlib
+from collections import deque, OrderedDict
+from contextlib import contextmanager, ExitStack
+from flask import Response, make_response, render_template, request, redirect, url_for, jsonify, flash, session, \
+    stream_with_context, send_from_directory, abort, has_request_context, got_request_exception
 from sqlalchemy import func
-from datetime import datetime
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from datetime import date, datetime, timedelta, timezone
 from werkzeug.utils import secure_filename
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
-from flask_mail import Mail, Message
 from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
-from flask_socketio import SocketIO
-from google.cloud import vision
+from wtforms.validators import ValidationError
+from flask_socketio import SocketIO, join_room, leave_room, rooms
+from socketio import PubSubManager, RedisManager, KafkaManager, ZmqManager, KombuManager
+from PIL import Image, ImageOps
+from config import basedir, ALLOWED_EXTENSIONS, IMAGE_VARIANTS, DASHBOARD_WINDOWS
+from models import db, create_app, User, Report, ArchivedReport, ReportRollup, HeatmapCell, ClassificationCache, \
+    OutboundEmail, next_report_version, current_report_version, latest_report_version, bump_rollup, \
+    record_status_change, record_latency, median_latency, record_heatmap, record_rollup_change, ROLLUP_COLUMNS, \
+    HEATMAP_CELL_ZOOMS, geohash_encode, GEOHASH_PRECISION_BY_ZOOM, SEARCH_DOCUMENT
 
 # --- App Configuration ---
-app = Flask(__name__)
-basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SECRET_KEY'] = 'a-very-secret-key-you-should-change'
-
-# --- Database Configuration ---
-DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'instance/reports.db'))
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# --- File Upload Configuration ---
-app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'static/uploads')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-# --- Email Configuration ---
-app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
-app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USE_SSL'] = False
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
-app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_USERNAME')
-app.config['MAIL_MAX_EMAILS'] = None
-app.config['MAIL_ASCII_ATTACHMENTS'] = False
+# Settings are in config.py and the models in models.py, which scripts can
+# load on their own. Google Vision and Flask-Mail are imported on first use.
+app = create_app()
+
+
+# --- Real-time Setup ---
+class LocalPubSubManager(PubSubManager):
+    name = 'local'
+    _inboxes = {}
+    _inboxes_lock = threading.Lock()
+
+    def __init__(self, url='local://', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox = queue.Queue()
+        if not write_only:
+            with self._inboxes_lock:
+                self._inboxes.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data):
+        for inbox in list(self._inboxes.get(self.channel, [])):
+            inbox.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+class RelayManagerMixin:
+    # Messages to the relay room carry raw events for the EventCoalescer on
+    # every server; no socket ever joins it.
+    relay_room = 'warrn_event_relay'
+    on_relay = None
+
+    def _handle_emit(self, message):
+        if message.get('room') == self.relay_room and self.on_relay:
+            self.on_relay(message['data'][0])
+        else:
+            super()._handle_emit(message)
+
+
+def relay_manager_class(url):
+    # Same choice of queue as Flask-SocketIO makes for message_queue
+    if url == 'local://':
+        base = LocalPubSubManager
+    elif url.startswith(('redis://', 'rediss://')):
+        base = RedisManager
+    elif url.startswith('kafka://'):
+        base = KafkaManager
+    elif url.startswith('zmq'):
+        base = ZmqManager
+    else:
+        base = KombuManager
+    return type(f'Relay{base.__name__}', (RelayManagerMixin, base), {})
+
+
+def socketio_options():
+    options = {'channel': app.config['SOCKETIO_CHANNEL']}
+    url = app.config['SOCKETIO_MESSAGE_QUEUE']
+    if url:
+        options['client_manager'] = relay_manager_class(url)(url, channel=options['channel'])
+    if app.config['SOCKETIO_WEBSOCKET_ONLY']:
+        options['transports'] = ['websocket']
+    return options
+
 
 # --- Initializations ---
-db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
-mail = Mail(app)
-socketio = SocketIO(app)
+socketio = SocketIO(app, **socketio_options())
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
 
-# --- Database Models ---
-class User(db.Model, UserMixin):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
-    role = db.Column(db.String(20), nullable=False, default='responder')
-    reports = db.relationship('Report', backref='responder', lazy=True)
-
-
-class Report(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    latitude = db.Column(db.Float, nullable=False)
-    longitude = db.Column(db.Float, nullable=False)
-    animal_type = db.Column(db.String(50), nullable=False)
-    condition = db.Column(db.String(50), nullable=False)
-    description = db.Column(db.String(200), nullable=True)
-    reporter_email = db.Column(db.String(120), nullable=False)
-    image_filename = db.Column(db.String(100), nullable=True)
-    status = db.Column(db.String(20), nullable=False, default='New')
-    responder_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    ai_species_suggestion = db.Column(db.String(50), nullable=True)
-    resolution_notes = db.Column(db.String(500), nullable=True)
-    resolution_image = db.Column(db.String(100), nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+# --- Instrumentation ---
+# Metrics live in this process; with several gunicorn workers each one keeps
+# its own series and a scrape reads whichever worker answers it.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def label_text(self, values, extra=None):
+        pairs = list(zip(self.labels, values)) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                              for k, v in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            series = sorted(self._series.items())
+        for values, state in series:
+            lines.extend(self.render_series(values, state))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render_series(self, values, state):
+        return [f'{self.name}_total{self.label_text(values)} {state}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            state = self._series.get(key)
+            if state is None:
+                state = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render_series(self, values, state):
+        counts, total, count = state[0], state[1], state[2]
+        lines = [f'{self.name}_bucket{self.label_text(values, ("le", bound))} {bucket_count}'
+                 for bound, bucket_count in zip(self.buckets, counts)]
+        lines.append(f'{self.name}_bucket{self.label_text(values, ("le", "+Inf"))} {count}')
+        lines.append(f'{self.name}_sum{self.label_text(values)} {round(total, 6)}')
+        lines.append(f'{self.name}_count{self.label_text(values)} {count}')
+        return lines
+
+
+METRICS = []
+REQUEST_SECONDS = Histogram('warrn_request_duration_seconds', 'Time spent handling HTTP requests.',
+                            ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = Histogram('warrn_request_sql_queries', 'SQL statements executed per HTTP request.',
+                            ('endpoint',), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('warrn_request_sql_duration_seconds', 'Time spent in SQL per HTTP request.',
+                                ('endpoint',))
+SQL_SECONDS = Histogram('warrn_sql_query_duration_seconds', 'Time spent executing single SQL statements.',
+                        ('context',))
+N_PLUS_ONE = Counter('warrn_sql_n_plus_one', 'Requests that repeated one SQL statement N_PLUS_ONE_THRESHOLD times.',
+                     ('endpoint',))
+EXTERNAL_SECONDS = Histogram('warrn_external_call_duration_seconds', 'Time spent calling external services.',
+                             ('service', 'operation', 'outcome'))
+REQUEST_EXCEPTIONS = Counter('warrn_request_exceptions', 'Unhandled exceptions raised by HTTP requests.',
+                             ('endpoint', 'exception'))
+HEATMAP_TILE_CACHE = Counter('warrn_heatmap_tile_cache', 'Heatmap tile lookups by cache result.', ('result',))
+
+
+@contextmanager
+def external_call(service, operation):
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        EXTERNAL_SECONDS.observe(time.perf_counter() - started, service=service, operation=operation, outcome=outcome)
+
+
+def request_endpoint():
+    # The route name rather than the path, so ids do not explode the series
+    return request.endpoint or 'unmatched'
+
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    stats = request.environ.get('warrn.sql_stats') if has_request_context() else None
+    SQL_SECONDS.observe(elapsed, context='request' if stats is not None else 'background')
+    if stats is not None:
+        stats['count'] += 1
+        stats['seconds'] += elapsed
+        stats['statements'][statement] = stats['statements'].get(statement, 0) + 1
+
+
+# Per-request state lives in the WSGI environ rather than g: a streamed
+# response finishes after its app context is gone.
+@app.before_request
+def start_request_timer():
+    request.environ['warrn.started'] = time.perf_counter()
+    request.environ['warrn.sql_stats'] = {'count': 0, 'seconds': 0.0, 'statements': {}}
+
+
+@app.after_request
+def record_response_status(response):
+    request.environ['warrn.status'] = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request(error=None):
+    # Runs once the response is finished, including streamed ones
+    if 'warrn.started' not in request.environ:
+        return
+    elapsed = time.perf_counter() - request.environ.pop('warrn.started')
+    stats = request.environ.pop('warrn.sql_stats')
+    endpoint = request_endpoint()
+    status = request.environ.get('warrn.status', 500)
+    if error is not None and not isinstance(error, GeneratorExit):
+        # Failed part-way through a stream; GeneratorExit is only the client leaving
+        status = 500
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=status)
+    REQUEST_QUERIES.observe(stats['count'], endpoint=endpoint)
+    REQUEST_SQL_SECONDS.observe(stats['seconds'], endpoint=endpoint)
+    repeated = [(count, statement) for statement, count in stats['statements'].items()
+                if count >= app.config['N_PLUS_ONE_THRESHOLD']]
+    if repeated:
+        N_PLUS_ONE.inc(endpoint=endpoint)
+        count, statement = max(repeated)
+        print(f"Possible N+1 query in {endpoint}: ran {count} times: {' '.join(statement.split())[:200]}")
+    slow_ms = app.config['SLOW_REQUEST_MS']
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        print(f"Slow request: {request.method} {request.full_path.rstrip('?')} -> {status} in {elapsed * 1000:.0f} ms "
+              f"({stats['count']} queries, {stats['seconds'] * 1000:.0f} ms SQL)")
+
+
+def count_request_exception(sender, exception, **extra):
+    REQUEST_EXCEPTIONS.inc(endpoint=request_endpoint(), exception=type(exception).__name__)
+
+
+got_request_exception.connect(count_request_exception, app)
+
+
+# --- Conditional Requests ---
+def report_etag(*parts):
+    # The settled cursor moves on once a late commit on Postgres becomes visible
+    versions = (latest_report_version(), current_report_version())
+    key = '|'.join(str(part) for part in versions + (request.query_string.decode(),) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def conditional_response(etag, render):
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# --- Responder Targeting ---
+# A responder's service area is a home point plus radius. Candidates are
+# found with a bounding-box query on the indexed service point (sized by the
+# largest allowed radius), then checked exactly with the haversine distance.
+def distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def service_area_error(latitude, longitude, radius_km):
+    # The area is optional, but a partial or out-of-range one would silently
+    # match every report or none
+    if (latitude is None) != (longitude is None):
+        return 'Enter both the latitude and the longitude of your service area.'
+    if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return 'Service area latitude must be between -90 and 90, longitude between -180 and 180.'
+    max_radius = app.config['RESPONDER_MAX_RADIUS_KM']
+    if radius_km is not None and not 0 < radius_km <= max_radius:
+        return f'Service radius must be more than 0 and at most {max_radius:g} km.'
+    return None
+
+
+def responders_for_location(latitude, longitude):
+    latitude, longitude = float(latitude), float(longitude)
+    max_radius = app.config['RESPONDER_MAX_RADIUS_KM']
+    lat_delta = max_radius / 111.0
+    lon_delta = max_radius / max(111.32 * math.cos(math.radians(latitude)), 0.01)
+    in_box = db.and_(User.service_latitude.between(latitude - lat_delta, latitude + lat_delta),
+                     User.service_longitude.between(longitude - lon_delta, longitude + lon_delta))
+    if app.config['NOTIFY_RESPONDERS_WITHOUT_AREA']:
+        in_box = db.or_(in_box, User.service_latitude.is_(None))
+    candidates = User.query.filter(User.role == 'responder', in_box).all()
+
+    responders = []
+    for user in candidates:
+        if user.service_latitude is None or user.service_longitude is None:
+            responders.append(user)
+            continue
+        radius = min(user.service_radius_km or app.config['RESPONDER_DEFAULT_RADIUS_KM'], max_radius)
+        if distance_km(latitude, longitude, user.service_latitude, user.service_longitude) <= radius:
+            responders.append(user)
+    return responders
+
+
+# --- Duplicate Detection ---
+# Open incidents from the last DEDUP_WINDOW_MINUTES are kept in a grid of
+# cells one radius wide, so a new report only checks the cells around it.
+# Each worker picks up reports filed by the others with one primary-key
+# range query before looking.
+OPEN_STATUSES = ('New', 'Acknowledged')
+
+
+class IncidentIndex:
+    def __init__(self, app):
+        self.app = app
+        self._cells = {}
+        self._order = deque()
+        self._ids = set()
+        self._last_id = None
+        self._lock = threading.Lock()
+
+    def _cell_size(self):
+        return self.app.config['DEDUP_RADIUS_M'] / 111000.0
+
+    def _add(self, report_id, latitude, longitude, animal_type, timestamp):
+        if report_id in self._ids:
+            return
+        size = self._cell_size()
+        cell = (int(latitude // size), int(longitude // size))
+        self._cells.setdefault(cell, []).append((report_id, latitude, longitude, animal_type.lower(), timestamp))
+        self._order.append((timestamp, cell, report_id))
+        self._ids.add(report_id)
+
+    def _discard(self, cell, report_id):
+        entries = [entry for entry in self._cells.get(cell, []) if entry[0] != report_id]
+        if entries:
+            self._cells[cell] = entries
+        else:
+            self._cells.pop(cell, None)
+        self._ids.discard(report_id)
+
+    def _refresh(self, cutoff):
+        while self._order and self._order[0][0] < cutoff:
+            _, cell, report_id = self._order.popleft()
+            self._discard(cell, report_id)
+        # The first call loads the window; later ones only reports filed since
+        query = db.session.query(Report.id, Report.latitude, Report.longitude, Report.animal_type, Report.timestamp,
+                                 Report.status, Report.parent_id)
+        if self._last_id is None:
+            last_id = db.session.query(func.max(Report.id)).scalar() or 0
+            query = query.filter(Report.timestamp >= cutoff)
+        else:
+            last_id = self._last_id
+            query = query.filter(Report.id > self._last_id)
+        for row in query.order_by(Report.id):
+            last_id = max(last_id, row.id)
+            if row.parent_id is None and row.status in OPEN_STATUSES and row.timestamp >= cutoff:
+                self._add(row.id, row.latitude, row.longitude, row.animal_type, row.timestamp)
+        self._last_id = last_id
+
+    def find_incident(self, latitude, longitude, animal_type, now):
+        # Nearest open incident of the same animal within the radius, or None
+        radius_km = self.app.config['DEDUP_RADIUS_M'] / 1000.0
+        if radius_km <= 0:
+            return None
+        cutoff = now - timedelta(minutes=self.app.config['DEDUP_WINDOW_MINUTES'])
+        size = self._cell_size()
+        row, col = int(latitude // size), int(longitude // size)
+        # Longitude cells narrow away from the equator, so check more of them
+        span = math.ceil(1 / max(math.cos(math.radians(latitude)), 0.01))
+        animal = animal_type.lower()
+        with self._lock:
+            self._refresh(cutoff)
+            candidates = []
+            for cell in [(row + dr, col + dc) for dr in (-1, 0, 1) for dc in range(-span, span + 1)]:
+                for report_id, lat, lon, entry_animal, timestamp in self._cells.get(cell, []):
+                    if entry_animal == animal and timestamp >= cutoff:
+                        distance = distance_km(latitude, longitude, lat, lon)
+                        if distance <= radius_km:
+                            candidates.append((distance, report_id, cell))
+        for _, report_id, cell in sorted(candidates):
+            incident = db.session.get(Report, report_id)
+            if incident is not None and incident.parent_id is None and incident.status in OPEN_STATUSES:
+                return incident
+            # Claimed through to resolution (or deleted) since it was indexed
+            with self._lock:
+                self._discard(cell, report_id)
+        return None
+
+    def add(self, report):
+        if self.app.config['DEDUP_RADIUS_M'] <= 0:
+            return
+        with self._lock:
+            self._add(report.id, report.latitude, report.longitude, report.animal_type, report.timestamp)
+
+
+incident_index = IncidentIndex(app)
+
+
+# --- Full-text Search ---
+def search_terms(search):
+    return re.findall(r'\w+', search.lower())[:10]
+
+
+def report_search(terms):
+    # Subquery of (id, score) for reports containing every term, higher score
+    # first. The last term also matches as a prefix, for search-as-you-type.
+    if db.engine.dialect.name == 'postgresql':
+        tsquery = func.to_tsquery(db.literal_column("'english'"), ' & '.join(terms[:-1] + [terms[-1] + ':*']))
+        document = db.literal_column(f"to_tsvector('english', {SEARCH_DOCUMENT})")
+        return db.select(Report.id.label('id'), func.ts_rank(document, tsquery).label('score')) \
+            .where(document.op('@@')(tsquery)).subquery()
+    match = ' '.join(f'"{term}"' for term in terms) + '*'
+    fts = db.literal_column('report_fts')
+    # bm25 is lower for better matches
+    return db.select(db.literal_column('report_fts.rowid').label('id'), (-func.bm25(fts)).label('score')) \
+        .select_from(db.text('report_fts')).where(fts.op('MATCH')(match)).subquery()
+
+
+# --- Real-time Events ---
+# Sockets join a room for their role (role_admin, role_responder) and their
+# user (user_<id>, used for service-area targeting). Map viewers join the
+# geohash tiles covering their viewport (tile_<hash>); a zoomed-out map that
+# would span too many tiles joins 'map', which receives every report.
+# Events go to every worker at once (through the message queue, if any).
+# Each worker buffers them for SOCKETIO_COALESCE_WINDOW seconds, then sends
+# each of its sockets one report_batch with the events for any of its rooms.
+def tile_room(geohash):
+    return f"tile_{geohash[:app.config['MAP_TILE_PRECISION']]}"
+
+
+def tile_rooms_for_bbox(west, south, east, north):
+    precision = app.config['MAP_TILE_PRECISION']
+    lon_step = 360.0 / 2 ** ((5 * precision + 1) // 2)
+    lat_step = 180.0 / 2 ** (5 * precision // 2)
+    west, east = max(west, -180.0), min(east, 180.0 - 1e-9)
+    south, north = max(south, -90.0), min(north, 90.0 - 1e-9)
+    if west > east or south > north:
+        return None
+    first_col, first_row = math.floor(west / lon_step), math.floor(south / lat_step)
+    cols = math.floor(east / lon_step) - first_col + 1
+    rows = math.floor(north / lat_step) - first_row + 1
+    if cols * rows > app.config['MAP_TILE_ROOM_LIMIT']:
+        return None
+    return {tile_room(geohash_encode((first_row + row + 0.5) * lat_step, (first_col + col + 0.5) * lon_step, precision))
+            for row in range(rows) for col in range(cols)}
+
+
+def report_rooms(report, responders=None):
+    # Admins and map viewers of the report's tile see every change; responders
+    # only reports in their service area plus the ones they have claimed.
+    if responders is None:
+        responders = responders_for_location(report.latitude, report.longitude)
+    targets = {'map', 'role_admin', tile_room(report.geohash)} | {f'user_{user.id}' for user in responders}
+    if report.responder_id:
+        targets.add(f'user_{report.responder_id}')
+    return sorted(targets)
+
+
+@socketio.on('connect')
+def join_socket_rooms(auth=None):
+    if current_user.is_authenticated:
+        join_room(f'user_{current_user.id}')
+        join_room(f'role_{current_user.role}')
+
+
+@socketio.on('watch_map')
+def watch_map_tiles(data):
+    try:
+        west, south, east, north = [float(v) for v in data['bbox']]
+    except (KeyError, TypeError, ValueError):
+        return
+    wanted = tile_rooms_for_bbox(west, south, east, north) or {'map'}
+    for room in rooms():
+        if (room == 'map' or room.startswith('tile_')) and room not in wanted:
+            leave_room(room)
+    for room in wanted:
+        join_room(room)
+
+
+class EventCoalescer:
+    def __init__(self, app, server):
+        self.app = app
+        self.server = server
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._started = False
+        manager = server.manager
+        self._relayed = isinstance(manager, RelayManagerMixin)
+        if self._relayed:
+            manager.on_relay = self._buffer
+
+    def start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            threading.Thread(target=self._run, name='event-coalescer', daemon=True).start()
+            self._started = True
+
+    def publish(self, event, data, targets):
+        self.publish_many([(event, data, targets)])
+
+    def publish_many(self, events):
+        events = [[event, data, list(targets)] for event, data, targets in events]
+        if self._relayed:
+            # Reaches this worker too, through the same handler
+            self.server.emit('report_events', events, to=RelayManagerMixin.relay_room)
+        else:
+            self._buffer(events)
+
+    def _buffer(self, events):
+        with self._lock:
+            for event, data, targets in events:
+                # A newer event of the same kind for the same report replaces the older one
+                self._pending.pop((event, data['id']), None)
+                self._pending[(event, data['id'])] = ({'event': event, 'data': data}, targets)
+        if self.app.config['SOCKETIO_COALESCE_WINDOW'] <= 0:
+            self.flush()
+        else:
+            self.start()
+            self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        manager = self.server.manager
+        batches = {}
+        for item, targets in pending.values():
+            for sid, _ in manager.get_participants('/', targets):
+                batches.setdefault(sid, []).append(item)
+        for sid, batch in batches.items():
+            try:
+                # Only sockets connected here; other workers flush their own
+                manager.emit('report_batch', batch, namespace='/', room=sid, ignore_queue=True)
+            except Exception as e:
+                print(f"Socket Error ({len(batch)} events to {sid}): {e}")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.app.config['SOCKETIO_COALESCE_WINDOW'])
+            self._wakeup.clear()
+            self.flush()
+
+
+event_coalescer = EventCoalescer(app, socketio.server)
 
 
 # --- Admin Panel Configuration ---
@@ -91,26 +608,48 @@ class AdminModelView(ModelView):
         return redirect(url_for('login'))
 
 class UserAdmin(AdminModelView):
-    column_list = ['id', 'username', 'email', 'role']
+    column_list = ['id', 'username', 'email', 'role', 'service_radius_km']
     column_searchable_list = ['username', 'email']
     column_filters = ['role']
-    column_labels = {'id': 'ID', 'username': 'Username', 'email': 'Email Address', 'role': 'User Role'}
+    column_labels = {'id': 'ID', 'username': 'Username', 'email': 'Email Address', 'role': 'User Role',
+                     'service_latitude': 'Service Area Latitude', 'service_longitude': 'Service Area Longitude',
+                     'service_radius_km': 'Service Radius (km)'}
     form_excluded_columns = ['password_hash', 'reports']
     column_formatters = {
         'role': lambda v, c, m, p: f'<span class="badge bg-{"danger" if m.role == "admin" else "primary" if m.role == "responder" else "secondary"}">{m.role.upper()}</span>'
     }
     list_template = 'admin/model/custom_list.html'
 
+    def on_model_change(self, form, model, is_created):
+        error = service_area_error(model.service_latitude, model.service_longitude, model.service_radius_km)
+        if error:
+            raise ValidationError(error)
+
+    def after_model_change(self, form, model, is_created):
+        user_cache.invalidate(model.id)
+
+    def after_model_delete(self, model):
+        user_cache.invalidate(model.id)
+
+def previous_value(model, name):
+    # Value of an attribute before the changes not yet flushed
+    history = db.inspect(model).attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(model, name)
+
+
 class ReportAdmin(AdminModelView):
-    column_list = ['id', 'timestamp', 'animal_type', 'condition', 'status', 'reporter_email', 'responder']
-    column_searchable_list = ['animal_type', 'reporter_email', 'description']
-    column_filters = ['status', 'animal_type', 'condition', 'timestamp']
+    column_list = ['id', 'timestamp', 'animal_type', 'condition', 'status', 'sighting_count', 'reporter_email',
+                   'responder']
+    column_searchable_list = ['description', 'resolution_notes', 'animal_type']
+    column_filters = ['status', 'animal_type', 'condition', 'timestamp', 'parent_id']
     column_labels = {
         'id': 'Report ID',
+        'parent_id': 'Sighting Of',
         'timestamp': 'Date & Time',
         'animal_type': 'Animal Type',
         'condition': 'Condition',
         'status': 'Status',
+        'sighting_count': 'Sightings',
         'reporter_email': 'Reporter Email',
         'responder': 'Assigned Responder'
     }
@@ -121,6 +660,103 @@ class ReportAdmin(AdminModelView):
     column_default_sort = ('timestamp', True)
     list_template = 'admin/model/custom_list.html'
 
+    def _lists_sightings(self):
+        # Sightings are folded into their incident unless filtered for
+        return any(self._filters[index].column.key == 'parent_id'
+                   for index, _, _ in self._get_list_extra_args().filters)
+
+    def get_query(self):
+        query = super().get_query()
+        return query if self._lists_sightings() else query.filter(Report.parent_id.is_(None))
+
+    def get_count_query(self):
+        query = super().get_count_query()
+        return query if self._lists_sightings() else query.filter(Report.parent_id.is_(None))
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        # Full-text index instead of LIKE '%term%' on every column; a bare
+        # animal name also matches the indexed animal_type column, and an
+        # email or its start the indexed reporter_email column
+        search = search.strip()
+        if not search:
+            return query, count_query, joins, count_joins
+        conditions = [Report.animal_type == search.capitalize(),
+                      db.and_(Report.reporter_email >= search, Report.reporter_email < search + '\U0010ffff')]
+        terms = search_terms(search)
+        if terms:
+            conditions.append(Report.id.in_(db.select(report_search(terms).c.id)))
+        condition = db.or_(*conditions)
+        query = query.filter(condition)
+        if count_query is not None:
+            count_query = count_query.filter(condition)
+        return query, count_query, joins, count_joins
+
+    @expose('/export/<export_type>/')
+    def export(self, export_type):
+        # Flask-Admin builds the whole export in memory; hand off to the
+        # streaming export, keeping the list's status and animal filters
+        args = {'format': 'csv'}
+        if self._lists_sightings():
+            args['include_sightings'] = 1
+        for index, _, value in self._get_list_extra_args().filters:
+            column_filter = self._filters[index]
+            if column_filter.operation() in ('equals', 'in list') and \
+                    column_filter.column.key in ('status', 'animal_type'):
+                args[column_filter.column.key] = value
+        return redirect(url_for('export_reports', **args))
+
+    def on_model_change(self, form, model, is_created):
+        # Any rollup key, position or parent may have been edited: take the
+        # report out of the aggregates as it was and count it as it is now
+        if is_created:
+            db.session.flush()
+        counted = model.parent_id is None
+        new = [getattr(model, name) for name in ROLLUP_COLUMNS] if counted else None
+        position = (model.latitude, model.longitude, model.timestamp)
+        if is_created:
+            old, old_position = None, None
+        else:
+            was_counted = previous_value(model, 'parent_id') is None
+            old = [previous_value(model, name) for name in ROLLUP_COLUMNS] if was_counted else None
+            old_position = tuple(previous_value(model, name) for name in ('latitude', 'longitude', 'timestamp')) \
+                if was_counted else None
+        record_rollup_change(old, new)
+        if old_position != (position if counted else None):
+            if old_position:
+                record_heatmap([old_position], -1)
+            if counted:
+                record_heatmap([position])
+
+    def on_model_delete(self, model):
+        if model.parent_id is None:
+            record_rollup_change([getattr(model, name) for name in ROLLUP_COLUMNS], None)
+            record_heatmap([(model.latitude, model.longitude, model.timestamp)], -1)
+        # Its sightings become reports of their own, as ondelete='SET NULL'
+        # declares; SQLite does not enforce it, so it is done here for both
+        sightings = Report.query.filter_by(parent_id=model.id).all()
+        for sighting in sightings:
+            sighting.parent_id = None
+            sighting.status = 'New'
+            record_rollup_change(None, [getattr(sighting, name) for name in ROLLUP_COLUMNS])
+        record_heatmap([(sighting.latitude, sighting.longitude, sighting.timestamp) for sighting in sightings])
+
+class ArchivedReportAdmin(AdminModelView):
+    # Read-only: archived reports are resolved and no longer change
+    can_create = False
+    can_edit = False
+    can_delete = False
+    column_list = ['id', 'timestamp', 'animal_type', 'condition', 'status', 'sighting_count', 'reporter_email',
+                   'responder', 'archived_at']
+    column_searchable_list = ['animal_type', 'reporter_email']
+    column_filters = ['animal_type', 'condition', 'timestamp', 'archived_at']
+    column_labels = dict(ReportAdmin.column_labels, archived_at='Archived')
+    column_formatters = {
+        'timestamp': lambda v, c, m, p: m.timestamp.strftime('%Y-%m-%d %H:%M'),
+        'archived_at': lambda v, c, m, p: m.archived_at.strftime('%Y-%m-%d %H:%M')
+    }
+    column_default_sort = ('timestamp', True)
+    list_template = 'admin/model/custom_list.html'
+
 class MyAdminIndexView(AdminIndexView):
     @expose('/')
     def index(self):
@@ -128,9 +764,11 @@ class MyAdminIndexView(AdminIndexView):
             return redirect(url_for('login'))
         
         total_users = User.query.count()
-        total_reports = Report.query.count()
-        new_reports = Report.query.filter_by(status='New').count()
-        resolved_reports = Report.query.filter_by(status='Resolved').count()
+        status_counts = dict(db.session.query(ReportRollup.status, func.sum(ReportRollup.count))
+                             .group_by(ReportRollup.status).all())
+        total_reports = sum(status_counts.values())
+        new_reports = status_counts.get('New', 0)
+        resolved_reports = status_counts.get('Resolved', 0)
         
         return self.render('admin/custom_index.html',
                          total_users=total_users,
@@ -141,34 +779,941 @@ class MyAdminIndexView(AdminIndexView):
 admin = Admin(app, name='WARRN Admin', template_mode='bootstrap4', url='/admin', index_view=MyAdminIndexView())
 admin.add_view(UserAdmin(User, db.session, name='Users', endpoint='user'))
 admin.add_view(ReportAdmin(Report, db.session, name='Reports', endpoint='report'))
+admin.add_view(ArchivedReportAdmin(ArchivedReport, db.session, name='Archive', endpoint='archived_report'))
+
+
+# --- Authentication ---
+class UserCache:
+    # Keeps a detached copy of each logged-in user for USER_CACHE_TTL seconds,
+    # so authenticated requests skip the user lookup. Other workers only see
+    # an admin's change to a user once their copy expires.
+    def __init__(self, app):
+        self.app = app
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, user):
+        ttl = self.app.config['USER_CACHE_TTL']
+        if ttl <= 0:
+            return
+        copy = User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+        make_transient_to_detached(copy)
+        with self._lock:
+            self._users[user.id] = (time.monotonic() + ttl, copy)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+user_cache = UserCache(app)
 
 
-# --- Helper Functions ---
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    cached = user_cache.get(int(user_id))
+    if cached is not None:
+        # Attach a copy to this request's session without querying
+        return db.session.merge(cached, load=False)
+    user = db.session.get(User, int(user_id))
+    if user is not None:
+        user_cache.put(user)
+    return user
+
+
+def run_blocking(function, *args):
+    # bcrypt keeps a CPU busy for a few hundred milliseconds. Under the
+    # eventlet worker that would stall every greenlet, so it runs in
+    # eventlet's pool of native threads instead.
+    eventlet = sys.modules.get('eventlet')
+    if eventlet is not None and eventlet.patcher.is_monkey_patched('thread'):
+        from eventlet import tpool
+        return tpool.execute(function, *args)
+    return function(*args)
+
+
+def hash_password(password):
+    return run_blocking(bcrypt.generate_password_hash, password).decode('utf-8')
+
+
+def password_cost(password_hash):
+    # $2b$12$... -> 12
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def check_password(user, password):
+    if not run_blocking(bcrypt.check_password_hash, user.password_hash, password):
+        return False
+    if password_cost(user.password_hash) != app.config['BCRYPT_LOG_ROUNDS']:
+        user.password_hash = hash_password(password)
+        db.session.commit()
+        user_cache.invalidate(user.id)
+    return True
+
+
+# --- Helper Functions ---
+
+
+def report_to_dict(report):
+    image_url = url_for('uploaded_file', filename=report.image_filename) if report.image_filename else None
+    thumb_url = image_variant_url(report.image_filename, 'thumb') if report.image_filename else None
+    return {'id': report.id, 'lat': report.latitude, 'lon': report.longitude, 'animal': report.animal_type,
+            'condition': report.condition, 'desc': report.description,
+            'time': report.timestamp.strftime('%Y-%m-%d %H:%M'), 'image_url': image_url, 'thumb_url': thumb_url,
+            'status': report.status, 'ai_suggestion': report.ai_species_suggestion,
+            'sightings': report.sighting_count or 0}
+
+
+@app.template_filter('format_minutes')
+def format_minutes(minutes):
+    if minutes is None:
+        return 'N/A'
+    if minutes < 60:
+        return f'{minutes} min'
+    if minutes < 1440:
+        return f'{minutes / 60:g} h'
+    return f'{minutes / 1440:g} days'
+
+
+def dashboard_query(status='', scope='all', window='all', user_id=None):
+    query = Report.query.options(db.joinedload(Report.responder)).filter(Report.parent_id.is_(None))
+    if status:
+        query = query.filter(Report.status == status)
+    if scope == 'mine':
+        query = query.filter(Report.responder_id == user_id)
+    elif scope == 'unclaimed':
+        query = query.filter(Report.responder_id.is_(None))
+    if DASHBOARD_WINDOWS.get(window):
+        # Whole minutes, so the dashboard ETag can follow the cutoff
+        cutoff = datetime.utcnow().replace(second=0, microsecond=0) - DASHBOARD_WINDOWS[window]
+        query = query.filter(Report.timestamp >= cutoff)
+    return query.order_by(Report.timestamp.desc(), Report.id.desc())
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def identify_animal_from_image(image_path):
+# --- Image Storage ---
+# Uploads are streamed to disk while being hashed and stored under their
+# content hash, so the same photo uploaded twice is kept once. The request
+# only parks the file in UPLOAD_FOLDER/pending/; the classification workers
+# strip its EXIF and write the resized variants (UPLOAD_FOLDER/<variant>/).
+def save_upload(file, prefix=''):
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.part')
     try:
-        client = vision.ImageAnnotatorClient()
-        with open(image_path, "rb") as image_file:
-            content = image_file.read()
-        image = vision.Image(content=content)
-        response = client.label_detection(image=image)
-        labels = response.label_annotations
-        known_animals = ["dog", "cat", "cattle", "cow", "monkey", "deer", "canine", "feline", "bird"]
-        for label in labels:
-            if label.description.lower() in known_animals:
-                return label.description.capitalize()
-        return None
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: file.stream.read(64 * 1024), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        filename = secure_filename(f"{prefix}{digest.hexdigest()}.{ext}")
+        pending_path = pending_upload_path(filename)
+        if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], filename)) or os.path.exists(pending_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(pending_path), exist_ok=True)
+            os.replace(temp_path, pending_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return filename
+
+
+def pending_upload_path(filename):
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'pending', filename)
+
+
+def finish_upload(filename):
+    # Publish a pending upload and write its variants. Safe to run more than
+    # once or concurrently: every file is written aside and moved into place.
+    image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(image_path):
+        pending_path = pending_upload_path(filename)
+        if not os.path.exists(pending_path):
+            return False
+        fd, temp_path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                normalize_image(pending_path, out)
+            os.replace(temp_path, image_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        try:
+            os.remove(pending_path)
+        except FileNotFoundError:
+            pass
+    for variant in IMAGE_VARIANTS:
+        write_image_variant(filename, variant)
+    return True
+
+
+def normalize_image(image_path, out):
+    # Apply the EXIF orientation to the pixels, then re-save without EXIF so
+    # location and device metadata are not published with the photo.
+    try:
+        with Image.open(image_path) as img:
+            if img.format in ('JPEG', 'PNG'):
+                ImageOps.exif_transpose(img).save(out, format=img.format, quality=90)
+                return
+    except Exception as e:
+        print(f"Image Error: {e}")
+    out.seek(0)
+    out.truncate()
+    with open(image_path, 'rb') as source:
+        shutil.copyfileobj(source, out)
+
+
+def image_variant_path(filename, variant):
+    return os.path.join(app.config['UPLOAD_FOLDER'], variant, filename.rsplit('.', 1)[0] + '.jpg')
+
+
+def write_image_variant(filename, variant):
+    variant_path = image_variant_path(filename, variant)
+    if os.path.exists(variant_path):
+        return
+    os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+    try:
+        with Image.open(os.path.join(app.config['UPLOAD_FOLDER'], filename)) as img:
+            img = ImageOps.exif_transpose(img).convert('RGB')
+            img.thumbnail((IMAGE_VARIANTS[variant], IMAGE_VARIANTS[variant]))
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(variant_path), suffix='.part')
+            with os.fdopen(fd, 'wb') as out:
+                img.save(out, format='JPEG', quality=80, optimize=True)
+            os.replace(temp_path, variant_path)
     except Exception as e:
-        print(f"Error calling Vision API: {e}")
+        print(f"Image Error: {e}")
+
+
+def image_variant_url(filename, variant):
+    return url_for('upload_variant', variant=variant, filename=filename)
+
+
+@app.route('/uploads/<filename>')
+def uploaded_file(filename):
+    filename = secure_filename(filename)
+    # A request that beats the classification workers finishes the upload
+    # itself; so does the first request for a photo from before variants.
+    if not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], filename)) and not finish_upload(filename):
+        abort(404)
+    # Names are content hashes, so an upload never changes once published
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=31536000)
+
+
+@app.route('/uploads/<variant>/<filename>')
+def upload_variant(variant, filename):
+    if variant not in IMAGE_VARIANTS:
+        abort(404)
+    filename = secure_filename(filename)
+    variant_path = image_variant_path(filename, variant)
+    if not os.path.exists(variant_path):
+        if not finish_upload(filename):
+            abort(404)
+        if not os.path.exists(variant_path):
+            return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_from_directory(os.path.dirname(variant_path), os.path.basename(variant_path), max_age=31536000)
+
+
+@app.route('/uploads/archive/<filename>')
+def archived_upload(filename):
+    # Images of archived reports: moved to the cold folder by
+    # archive_reports.py --move-images, or still in uploads if shared
+    filename = secure_filename(filename)
+    for folder in (app.config['ARCHIVE_IMAGE_FOLDER'], app.config['UPLOAD_FOLDER']):
+        if os.path.exists(os.path.join(folder, filename)):
+            return send_from_directory(folder, filename, max_age=31536000)
+    if finish_upload(filename):
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=31536000)
+    abort(404)
+
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    flash(f"That image is too large. The limit is {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB.", 'danger')
+    return redirect(request.referrer or url_for('index'))
+
+
+# --- Image Classification ---
+# Backends return the raw label descriptions for each image in a batch (None
+# for an image the backend could not annotate); matching against known animals
+# happens in match_known_animal so every backend behaves the same way.
+class VisionClassifier:
+    # google.cloud.vision takes a noticeable part of startup, so it is only
+    # imported when the first image is classified
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google.cloud import vision
+                    self._client = vision.ImageAnnotatorClient()
+        return self._client
+
+    def batch_labels(self, contents):
+        client = self.client
+        from google.cloud import vision
+        features = [vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION)]
+        requests = [vision.AnnotateImageRequest(image=vision.Image(content=content), features=features)
+                    for content in contents]
+        response = client.batch_annotate_images(requests=requests)
+        results = []
+        for item in response.responses:
+            if item.error.message:
+                print(f"Error calling Vision API: {item.error.message}")
+                results.append(None)
+            else:
+                results.append([label.description for label in item.label_annotations])
+        return results
+
+
+class StubClassifier:
+    def __init__(self, labels):
+        self._labels = [label.strip() for label in labels.split(',') if label.strip()]
+
+    def batch_labels(self, contents):
+        return [list(self._labels) for _ in contents]
+
+
+CLASSIFIER_BACKENDS = {
+    'vision': lambda: VisionClassifier(),
+    'stub': lambda: StubClassifier(app.config['STUB_CLASSIFIER_LABELS']),
+}
+_classifier = None
+
+
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        _classifier = CLASSIFIER_BACKENDS[app.config['CLASSIFIER_BACKEND']]()
+    return _classifier
+
+
+def match_known_animal(labels):
+    known_animals = ["dog", "cat", "cattle", "cow", "monkey", "deer", "canine", "feline", "bird"]
+    for label in labels or []:
+        if label.lower() in known_animals:
+            return label.capitalize()
+    return None
+
+
+def perceptual_hash(content):
+    # 64-bit difference hash: survives re-encoding, resizing and small edits,
+    # so near-identical uploads of the same incident share a cache entry.
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            pixels = list(img.convert('L').resize((9, 8)).getdata())
+    except Exception:
         return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
+
+
+def lookup_cached_labels(content_hash, image_hash):
+    cutoff = datetime.utcnow() - timedelta(days=app.config['CLASSIFICATION_CACHE_TTL_DAYS'])
+    entry = db.session.get(ClassificationCache, content_hash)
+    if (entry is None or entry.created_at < cutoff) and image_hash:
+        entry = ClassificationCache.query.filter(ClassificationCache.image_hash == image_hash,
+                                                 ClassificationCache.created_at >= cutoff).first()
+    if entry is None or entry.created_at < cutoff:
+        return None
+    entry.hits += 1
+    entry.last_used_at = datetime.utcnow()
+    return entry.labels.split(',') if entry.labels else []
+
+
+def store_cached_labels(content_hash, image_hash, labels):
+    now = datetime.utcnow()
+    entry = db.session.get(ClassificationCache, content_hash)
+    if entry is None:
+        entry = ClassificationCache(content_hash=content_hash)
+        db.session.add(entry)
+    entry.image_hash = image_hash
+    entry.labels = ','.join(labels)
+    entry.created_at = now
+    entry.last_used_at = now
+
+
+def evict_classification_cache():
+    cutoff = datetime.utcnow() - timedelta(days=app.config['CLASSIFICATION_CACHE_TTL_DAYS'])
+    ClassificationCache.query.filter(ClassificationCache.created_at < cutoff).delete(synchronize_session=False)
+    overflow = ClassificationCache.query.count() - app.config['CLASSIFICATION_CACHE_MAX_ENTRIES']
+    if overflow > 0:
+        oldest = db.session.query(ClassificationCache.content_hash) \
+            .order_by(ClassificationCache.last_used_at).limit(overflow)
+        ClassificationCache.query.filter(ClassificationCache.content_hash.in_(oldest.scalar_subquery())) \
+            .delete(synchronize_session=False)
+
+
+def classify_images(contents):
+    # Repeat and near-duplicate images are answered from the cache; the rest
+    # go to the backend in a single batch request.
+    fingerprints = [(hashlib.sha256(content).hexdigest(), perceptual_hash(content)) for content in contents]
+    labels_by_hash = {}
+    misses = {}
+    for (content_hash, image_hash), content in zip(fingerprints, contents):
+        if content_hash in labels_by_hash or content_hash in misses:
+            continue
+        cached = lookup_cached_labels(content_hash, image_hash)
+        if cached is not None:
+            labels_by_hash[content_hash] = cached
+        else:
+            misses[content_hash] = (content, image_hash)
+
+    if misses:
+        hashes = list(misses)
+        with external_call(app.config['CLASSIFIER_BACKEND'], 'batch_labels'):
+            results = get_classifier().batch_labels([misses[h][0] for h in hashes])
+        for content_hash, labels in zip(hashes, results):
+            if labels is None:
+                continue
+            labels_by_hash[content_hash] = labels
+            store_cached_labels(content_hash, misses[content_hash][1], labels)
+        evict_classification_cache()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker cached the same image first
+        db.session.rollback()
+    return [match_known_animal(labels_by_hash.get(content_hash)) for content_hash, _ in fingerprints]
+
+
+class ClassificationPool:
+    def __init__(self, app):
+        self.app = app
+        self._jobs = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._jobs is not None:
+            return
+        with self._lock:
+            if self._jobs is not None:
+                return
+            jobs = queue.Queue(maxsize=self.app.config['CLASSIFIER_QUEUE_SIZE'])
+            for i in range(self.app.config['CLASSIFIER_WORKERS']):
+                worker = threading.Thread(target=self._run, args=(jobs,), name=f'classifier-{i}', daemon=True)
+                worker.start()
+            self._jobs = jobs
+
+    def submit(self, image_filename, report_id=None):
+        # Every upload is finished here; only report photos are classified
+        self.start()
+        try:
+            self._jobs.put_nowait((report_id, image_filename))
+            return True
+        except queue.Full:
+            # Left pending: the first request for the image finishes it
+            print(f"Classification queue full, skipping {image_filename}")
+            return False
+
+    def _next_batch(self, jobs):
+        # Wait for one job, then give concurrent uploads a short window to
+        # join the same batch request.
+        batch = [jobs.get()]
+        deadline = time.monotonic() + self.app.config['CLASSIFIER_BATCH_WINDOW']
+        while len(batch) < self.app.config['CLASSIFIER_BATCH_SIZE']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _classify(self, batch):
+        jobs = []
+        for report_id, image_filename in batch:
+            try:
+                finish_upload(image_filename)
+                if report_id is None:
+                    continue
+                with open(os.path.join(self.app.config['UPLOAD_FOLDER'], image_filename), 'rb') as image_file:
+                    jobs.append((report_id, image_file.read()))
+            except OSError as e:
+                print(f"Classification Error ({image_filename}): {e}")
+        if not jobs:
+            return
+        suggestions = classify_images([content for _, content in jobs])
+        classified = [(report_id, suggestion) for (report_id, _), suggestion in zip(jobs, suggestions) if suggestion]
+        for report_id, suggestion in classified:
+            Report.query.filter_by(id=report_id).update({'ai_species_suggestion': suggestion,
+                                                         'version': next_report_version(db.session),
+                                                         'updated_at': datetime.utcnow()})
+        db.session.commit()
+        reports = {row.id: row for row in
+                   db.session.query(Report.id, Report.latitude, Report.longitude, Report.geohash, Report.responder_id)
+                   .filter(Report.id.in_([report_id for report_id, _ in classified]))}
+        for report_id, suggestion in classified:
+            event_coalescer.publish('report_classified', {'id': report_id, 'ai_suggestion': suggestion},
+                                    report_rooms(reports[report_id]))
+
+    def _run(self, jobs):
+        with self.app.app_context():
+            while True:
+                batch = self._next_batch(jobs)
+                try:
+                    self._classify(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Classification Error ({[image_filename for _, image_filename in batch]}): {e}")
+                finally:
+                    db.session.remove()
+                    for _ in batch:
+                        jobs.task_done()
+
+
+classification_pool = ClassificationPool(app)
+
+
+# --- Notification Queue ---
+# Emails are spooled in the outbound_email table and delivered by background
+# workers, so request handlers never wait on SMTP. A message being sent holds a
+# lease (next_attempt_at in the future); if the process dies mid-send the lease
+# expires and another worker picks it up.
+def mail_enabled():
+    return bool(app.config['MAIL_USERNAME'] and app.config['MAIL_PASSWORD'])
+
+
+_mail_lock = threading.Lock()
+
+
+def get_mail():
+    # Flask-Mail is set up by the first worker that sends something
+    if 'mail' not in app.extensions:
+        with _mail_lock:
+            if 'mail' not in app.extensions:
+                from flask_mail import Mail
+                Mail(app)
+    return app.extensions['mail']
+
+
+def queue_email(subject, recipients, body, attachment=None):
+    recipients = [r for r in recipients if r]
+    if not recipients:
+        return None
+    email = OutboundEmail(subject=subject, sender=app.config['MAIL_USERNAME'], recipients=','.join(recipients),
+                          body=body, attachment=attachment)
+    db.session.add(email)
+    return email
+
+
+def queue_claimed_email(report, responder_name):
+    map_link = f"https://www.google.com/maps?q={report.latitude},{report.longitude}"
+    return queue_email('👍 Report Claimed - WARRN', [report.reporter_email], f"""Good news! Your report has been claimed by a responder.
+
+Report Details:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📋 Report ID: #{report.id}
+🐾 Animal Type: {report.animal_type}
+⚠️  Condition: {report.condition}
+📍 Location: {map_link}
+👤 Responder: {responder_name}
+✅ Status: Acknowledged
+
+A responder is now working on this incident.
+You will be notified when it is resolved.
+
+Thank you for your patience! 🙏
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+WARRN - Wildlife Animal Rescue & Response Network
+""")
+
+
+def queue_resolved_email(report, responder_name, resolution_notes, resolution_image):
+    map_link = f"https://www.google.com/maps?q={report.latitude},{report.longitude}"
+    resolution_text = f'📝 Resolution Notes:\n{resolution_notes}\n\n' if resolution_notes else ''
+    return queue_email('✅ Report Resolved - WARRN', [report.reporter_email], f"""Great news! Your report has been resolved.
+
+Report Details:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📋 Report ID: #{report.id}
+🐾 Animal Type: {report.animal_type}
+⚠️  Condition: {report.condition}
+📍 Location: {map_link}
+👤 Responder: {responder_name}
+✅ Status: *** RESOLVED ***
+
+{resolution_text}The incident has been successfully handled.
+Thank you for reporting and helping save an animal's life!
+
+Your compassion makes a difference. ❤️
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+WARRN - Wildlife Animal Rescue & Response Network
+""", attachment=resolution_image)
+
+
+def incident_lines(reports):
+    return '\n'.join(f"📋 #{report.id}: {report.animal_type} ({report.condition}) - "
+                     f"https://www.google.com/maps?q={report.latitude},{report.longitude}"
+                     for report in reports)
+
+
+def queue_assignment_email(responder, reports):
+    report_lines = incident_lines(reports)
+    return queue_email(f'📌 {len(reports)} Report(s) Assigned to You - WARRN', [responder.email], f"""Hello {responder.username},
+
+A coordinator has assigned the following report(s) to you:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+{report_lines}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+Open your dashboard to follow up on them.
+
+WARRN - Wildlife Animal Rescue & Response Network
+""")
+
+
+def queue_received_summary_email(reporter_email, reports):
+    return queue_email(f'✅ {len(reports)} Report(s) Received - WARRN', [reporter_email], f"""Thank you for reporting animal incidents!
+
+Your Reports:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+{incident_lines(reports)}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+Your reports have been received and our responders have been notified.
+You will receive updates when they are claimed and resolved.
+
+Thank you for helping animals! 🐾
+WARRN - Wildlife Animal Rescue & Response Network
+""")
+
+
+def queue_sighting_email(report, incident):
+    map_link = f"https://www.google.com/maps?q={incident.latitude},{incident.longitude}"
+    return queue_email('✅ Sighting Received - WARRN', [report.reporter_email], f"""Thank you for reporting an animal incident!
+
+This {incident.animal_type.lower()} had already been reported nearby, so your report was added to
+incident #{incident.id} as a sighting. Responders were notified when it was first reported.
+
+Incident Details:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📋 Incident ID: #{incident.id}
+🐾 Animal Type: {incident.animal_type}
+⚠️  Condition: {incident.condition}
+📍 Location: {map_link}
+📊 Status: {incident.status}
+
+Thank you for helping animals! 🐾
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+WARRN - Wildlife Animal Rescue & Response Network
+""")
+
+
+def queue_incident_summary_email(responder, reports):
+    return queue_email(f'🚨 {len(reports)} New Animal Incident(s) Reported!', [responder.email], f"""New animal incidents have been reported in your area on WARRN.
+
+Incidents:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+{incident_lines(reports)}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+Please log in to the WARRN dashboard to claim and respond to these incidents.
+
+Thank you for your service! 🙏
+WARRN - Wildlife Animal Rescue & Response Network
+""")
+
+
+class NotificationQueue:
+    def __init__(self, app):
+        self.app = app
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.app.config['MAIL_WORKERS']):
+                worker = threading.Thread(target=self._run, name=f'mail-worker-{i}', daemon=True)
+                worker.start()
+            self._started = True
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _claim_next(self):
+        now = datetime.utcnow()
+        while True:
+            email = OutboundEmail.query.filter(OutboundEmail.status.in_(['queued', 'sending']),
+                                               OutboundEmail.next_attempt_at <= now) \
+                .order_by(OutboundEmail.next_attempt_at, OutboundEmail.id).first()
+            if email is None:
+                db.session.rollback()
+                return None
+            lease_until = now + timedelta(seconds=self.app.config['MAIL_SEND_LEASE'])
+            claimed = OutboundEmail.query.filter_by(id=email.id, status=email.status) \
+                .filter(OutboundEmail.next_attempt_at <= now) \
+                .update({'status': 'sending', 'next_attempt_at': lease_until}, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(OutboundEmail, email.id)
+
+    def _build_message(self, email):
+        from flask_mail import Message
+        msg = Message(subject=email.subject, sender=email.sender, recipients=email.recipients.split(','))
+        msg.body = email.body
+        if email.attachment:
+            finish_upload(email.attachment)
+            image_path = os.path.join(self.app.config['UPLOAD_FOLDER'], email.attachment)
+            if os.path.exists(image_path):
+                with open(image_path, 'rb') as img:
+                    msg.attach(email.attachment, 'image/jpeg', img.read())
+        return msg
+
+    def _mark_failed(self, email_id, error):
+        # The failed send or commit may have left the session mid-transaction
+        db.session.rollback()
+        email = db.session.get(OutboundEmail, email_id)
+        email.attempts += 1
+        email.last_error = str(error)[:500]
+        if email.attempts >= self.app.config['MAIL_MAX_ATTEMPTS']:
+            email.status = 'failed'
+        else:
+            delay = self.app.config['MAIL_RETRY_BACKOFF'] * 2 ** (email.attempts - 1)
+            email.status = 'queued'
+            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+        print(f"Email Error (message #{email.id}, attempt {email.attempts}): {error}")
+
+    def _drain(self):
+        # One SMTP connection is reused for every message due in this burst.
+        email = self._claim_next()
+        if email is None:
+            return
+        email_id = email.id
+        try:
+            with ExitStack() as stack:
+                with external_call('smtp', 'connect'):
+                    connection = stack.enter_context(get_mail().connect())
+                while email is not None:
+                    message = self._build_message(email)
+                    with external_call('smtp', 'send'):
+                        connection.send(message)
+                    email.status = 'sent'
+                    email.attempts += 1
+                    email.sent_at = datetime.utcnow()
+                    db.session.commit()
+                    email = None
+                    email = self._claim_next()
+                    email_id = email.id if email is not None else None
+        except Exception as e:
+            if email is not None:
+                self._mark_failed(email_id, e)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self._drain()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Email Error: {e}")
+                finally:
+                    db.session.remove()
+                self._wakeup.wait(self.app.config['MAIL_POLL_INTERVAL'])
+                self._wakeup.clear()
+
+
+notification_queue = NotificationQueue(app)
+
+
+@app.before_request
+def start_background_workers():
+    # Called when a worker process starts (gunicorn.conf.py, __main__), so
+    # queued and lease-expired emails go out after a restart without waiting
+    # for a visitor; the request hook covers servers without that hook
+    if mail_enabled():
+        notification_queue.start()
+
+
+# --- Report Transitions ---
+# Status changes are conditional UPDATEs: the WHERE clause carries the status
+# a report must still be in, so when two responders claim at once exactly one
+# statement matches the row. RETURNING hands back what rollups, emails and
+# socket events need, so there is no read-modify-write round trip.
+TRANSITION_RETURNING = (Report.id, Report.timestamp, Report.animal_type, Report.condition, Report.latitude,
+                        Report.longitude, Report.geohash, Report.reporter_email, Report.responder_id, Report.version)
+
+
+def transition_reports(report_ids, from_status, values, *criteria):
+    now = datetime.utcnow()
+    to_status = values.get('status', from_status)
+    values = dict(values, version=next_report_version(db.session), updated_at=now)
+    if from_status == 'New' and to_status == 'Acknowledged':
+        values['claimed_at'] = now
+    elif to_status == 'Resolved':
+        values['resolved_at'] = now
+    statement = db.update(Report).where(Report.id.in_(report_ids), Report.status == from_status, *criteria) \
+        .values(**values).returning(*TRANSITION_RETURNING)
+    rows = db.session.execute(statement, execution_options={'synchronize_session': False}).all()
+    for row in rows:
+        if to_status != from_status:
+            record_status_change(row, from_status, to_status)
+        if 'claimed_at' in values:
+            record_latency('claim', row.timestamp, now)
+        elif 'resolved_at' in values:
+            record_latency('resolve', row.timestamp, now)
+    return rows
+
+
+def claimed_event(report, responder):
+    return ('report_claimed', {'id': report.id, 'status': 'Acknowledged', 'version': report.version,
+                               'responder': responder.username, 'responder_id': responder.id,
+                               'resolve_url': url_for('resolve_report', report_id=report.id)}, report_rooms(report))
+
+
+def resolved_event(report):
+    return ('report_resolved', {'id': report.id, 'status': 'Resolved', 'version': report.version},
+            report_rooms(report))
+
+
+def new_report_payload(report):
+    data = report_to_dict(report)
+    data.update({'responder': None, 'claim_url': url_for('claim_report', report_id=report.id),
+                 'medium_url': image_variant_url(report.image_filename, 'medium') if report.image_filename else None})
+    return data
+
+
+# --- Report Ingestion ---
+# Partner hotlines and SMS gateways forward incidents in bulk to /api/ingest
+# with an X-API-Key header. Rows are validated as they are read and inserted
+# in chunks of INGEST_CHUNK_SIZE, each in its own transaction, so a bad row or
+# a failed chunk never aborts the rest of the batch.
+INGEST_TEXT_FIELDS = {'animal_type': 50, 'condition': 50, 'description': 200, 'reporter_email': 120}
+
+
+def ingest_partner():
+    provided = request.headers.get('X-API-Key', '')
+    for entry in app.config['INGEST_API_KEYS']:
+        partner, _, key = entry.partition(':')
+        if provided and key and hmac.compare_digest(provided, key):
+            return partner
+    return None
+
+
+def ingest_rows():
+    # NDJSON is read line by line from the request stream; JSON may be a list
+    # of rows or {"reports": [...]}
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return (line for line in request.stream if line.strip())
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('reports')
+    return payload if isinstance(payload, list) else None
+
+
+def parse_ingest_row(item):
+    if isinstance(item, (str, bytes)):
+        try:
+            item = json.loads(item)
+        except ValueError:
+            return None, 'invalid JSON'
+    if not isinstance(item, dict):
+        return None, 'row must be a JSON object'
+    try:
+        latitude, longitude = float(item['latitude']), float(item['longitude'])
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None, 'latitude and longitude are required numbers'
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None, 'latitude or longitude out of range'
+    values = {'latitude': latitude, 'longitude': longitude}
+    for field, max_length in INGEST_TEXT_FIELDS.items():
+        value = item.get(field) or ''
+        if not isinstance(value, str) or len(value) > max_length:
+            return None, f'{field} must be text of at most {max_length} characters'
+        values[field] = value.strip()
+    if not values['animal_type'] or not values['condition']:
+        return None, 'animal_type and condition are required'
+    values['description'] = values['description'] or None
+    try:
+        timestamp = datetime.fromisoformat(item['timestamp']) if item.get('timestamp') else datetime.utcnow()
+        # Stored naive in UTC like every other timestamp; partners may send any offset
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError, OverflowError):
+        return None, 'timestamp must be ISO 8601'
+    values['timestamp'] = timestamp
+    return values, None
+
+
+def insert_report_rows(rows):
+    # One multi-row INSERT for the chunk; the geohash listener does not run
+    # for bulk inserts, so geohash, version and rollups are filled in here.
+    now = datetime.utcnow()
+    version = next_report_version(db.session)
+    rows = [dict(values, status='New', geohash=geohash_encode(values['latitude'], values['longitude']),
+                 version=version, updated_at=now) for values in rows]
+    ids = db.session.scalars(db.insert(Report).returning(Report.id, sort_by_parameter_order=True), rows).all()
+    counts = {}
+    for values in rows:
+        key = (values['timestamp'].date(), values['animal_type'], values['condition'])
+        counts[key] = counts.get(key, 0) + 1
+    for (day, animal_type, condition), count in counts.items():
+        bump_rollup(ReportRollup, count, day=day, status='New', animal_type=animal_type, condition=condition)
+    record_heatmap([(values['latitude'], values['longitude'], values['timestamp']) for values in rows])
+    db.session.commit()
+    return [Report(id=report_id, **values) for report_id, values in zip(ids, rows)]
+
+
+def ingest_chunk(chunk, results):
+    try:
+        reports = insert_report_rows([values for _, values in chunk])
+    except Exception as e:
+        db.session.rollback()
+        print(f"Ingest Error (rows {chunk[0][0]}-{chunk[-1][0]}): {e}")
+        results.extend({'row': row, 'ok': False, 'error': 'could not be saved'} for row, _ in chunk)
+        return []
+    results.extend({'row': row, 'ok': True, 'id': report.id} for (row, _), report in zip(chunk, reports))
+    return reports
+
+
+def notify_ingested_reports(reports):
+    # One email per reporter and per responder for the whole batch, and all
+    # socket events handed to the coalescer together
+    responders_at, by_reporter, by_responder, events = {}, {}, {}, []
+    for report in reports:
+        location = (report.latitude, report.longitude)
+        if location not in responders_at:
+            responders_at[location] = responders_for_location(*location)
+        responders = responders_at[location]
+        events.append(('new_report', new_report_payload(report), report_rooms(report, responders)))
+        if report.reporter_email:
+            by_reporter.setdefault(report.reporter_email, []).append(report)
+        for responder in responders:
+            by_responder.setdefault(responder.id, (responder, []))[1].append(report)
+    if mail_enabled():
+        for reporter_email, reporter_reports in by_reporter.items():
+            queue_received_summary_email(reporter_email, reporter_reports)
+        for responder, responder_reports in by_responder.values():
+            queue_incident_summary_email(responder, responder_reports)
+        db.session.commit()
+        notification_queue.wake()
+    event_coalescer.publish_many(events)
 
 
 # --- Routes ---
@@ -180,47 +1725,38 @@ def index():
 @app.route('/report', methods=['POST'])
 def submit_report():
     image_filename = None
-    ai_suggestion = None
 
     if 'image' in request.files:
         file = request.files['image']
         if file and file.filename != '' and allowed_file(file.filename):
-            ext = file.filename.rsplit('.', 1)[1].lower()
-            unique_id = uuid.uuid4().hex
-            filename = secure_filename(f"{unique_id}.{ext}")
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(image_path)
-            image_filename = filename
-            ai_suggestion = identify_animal_from_image(image_path)
+            image_filename = save_upload(file)
 
     new_report = Report(latitude=request.form['latitude'], longitude=request.form['longitude'],
                         animal_type=request.form['animal_type'], condition=request.form['condition'],
                         description=request.form['description'], reporter_email=request.form['reporter_email'],
-                        image_filename=image_filename, ai_species_suggestion=ai_suggestion)
+                        image_filename=image_filename, timestamp=datetime.utcnow())
+    incident = incident_index.find_incident(float(new_report.latitude), float(new_report.longitude),
+                                            new_report.animal_type, new_report.timestamp)
+    if incident is not None:
+        return link_sighting(new_report, incident)
     db.session.add(new_report)
+    db.session.flush()
+    record_status_change(new_report, None, new_report.status)
+    record_heatmap([(new_report.latitude, new_report.longitude, new_report.timestamp)])
     db.session.commit()
+    incident_index.add(new_report)
 
-    image_url = url_for('static',
-                        filename=f'uploads/{new_report.image_filename}') if new_report.image_filename else None
-    report_data = {'id': new_report.id, 'lat': new_report.latitude, 'lon': new_report.longitude,
-                   'animal': new_report.animal_type, 'condition': new_report.condition, 'desc': new_report.description,
-                   'time': new_report.timestamp.strftime('%Y-%m-%d %H:%M'), 'status': new_report.status,
-                   'responder': None, 'image_url': image_url, 'ai_suggestion': new_report.ai_species_suggestion,
-                   'claim_url': url_for('claim_report', report_id=new_report.id)}
-    socketio.emit('new_report', report_data)
-
-    # Send email notifications
-    if app.config['MAIL_USERNAME'] and app.config['MAIL_PASSWORD']:
-        try:
-            map_link = f"https://www.google.com/maps?q={new_report.latitude},{new_report.longitude}"
-            
-            # Send confirmation to reporter
-            reporter_msg = Message(
-                subject='✅ Report Received - WARRN',
-                sender=app.config['MAIL_USERNAME'],
-                recipients=[new_report.reporter_email]
-            )
-            reporter_msg.body = f"""Thank you for reporting an animal incident!
+    responders = responders_for_location(new_report.latitude, new_report.longitude)
+    event_coalescer.publish('new_report', new_report_payload(new_report), report_rooms(new_report, responders))
+    if image_filename:
+        classification_pool.submit(image_filename, new_report.id)
+
+    # Queue email notifications
+    if mail_enabled():
+        map_link = f"https://www.google.com/maps?q={new_report.latitude},{new_report.longitude}"
+
+        # Confirmation to reporter
+        queue_email('✅ Report Received - WARRN', [new_report.reporter_email], f"""Thank you for reporting an animal incident!
 
 Your Report Details:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -237,19 +1773,11 @@ You will receive updates when the report is claimed and resolved.
 Thank you for helping animals! 🐾
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 WARRN - Wildlife Animal Rescue & Response Network
-"""
-            mail.send(reporter_msg)
-            
-            # Send notification to responders
-            responders = User.query.filter_by(role='responder').all()
-            responder_emails = [user.email for user in responders]
-            if responder_emails:
-                responder_msg = Message(
-                    subject='🚨 New Animal Incident Reported!',
-                    sender=app.config['MAIL_USERNAME'],
-                    recipients=responder_emails
-                )
-                responder_msg.body = f"""A new animal incident has been reported on WARRN.
+""")
+
+        # Notification to responders covering this location
+        responder_emails = [user.email for user in responders]
+        queue_email('🚨 New Animal Incident Reported!', responder_emails, f"""A new animal incident has been reported on WARRN.
 
 Incident Details:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -265,29 +1793,415 @@ Please log in to the WARRN dashboard to claim and respond to this incident.
 Thank you for your service! 🙏
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 WARRN - Wildlife Animal Rescue & Response Network
-"""
-                mail.send(responder_msg)
-            flash('Report submitted! Confirmation email sent to you and responders notified.', 'success')
-        except Exception as e:
-            print(f"Email Error: {e}")
-            flash('Report submitted, but email notification failed.', 'warning')
+""")
+        db.session.commit()
+        notification_queue.wake()
+        flash('Report submitted! A confirmation email is on its way and responders are being notified.', 'success')
     else:
         flash('Report submitted successfully!', 'info')
 
     return redirect(url_for('index'))
 
 
+def link_sighting(report, incident):
+    # A follow-up of an incident that is already open: no Vision call,
+    # responder emails or new_report broadcast, only the incident's count
+    report.parent_id = incident.id
+    report.status = 'Sighting'
+    incident.sighting_count = Report.sighting_count + 1
+    db.session.add(report)
+    db.session.commit()
+    event_coalescer.publish('report_sighting', {'id': incident.id, 'sightings': incident.sighting_count},
+                            report_rooms(incident))
+    if report.image_filename:
+        classification_pool.submit(report.image_filename)
+    if mail_enabled():
+        queue_sighting_email(report, incident)
+        db.session.commit()
+        notification_queue.wake()
+    flash(f'Thank you! This animal was already reported nearby, so your report was added to incident '
+          f'#{incident.id} as a sighting.', 'info')
+    return redirect(url_for('index'))
+
+
 @app.route('/api/reports')
 def get_reports():
-    reports_list = []
-    reports = Report.query.order_by(Report.timestamp.desc()).all()
+    if request.args.get('since'):
+        view = get_report_changes
+    elif request.args.get('bbox'):
+        view = get_map_reports
+    else:
+        view = stream_report_list
+    return conditional_response(report_etag(), view)
+
+
+def get_report_changes():
+    # Delta feed: reports created or changed (claimed, resolved, classified)
+    # after the given cursor, oldest change first. Start from the "since" of a
+    # list or map response (or 0 for everything) and pass the returned cursor
+    # back as ?since= to keep following changes.
+    try:
+        since = request.args['since']
+        since_version, since_id = (int(v) for v in since.split('_')) if '_' in since else (int(since), None)
+    except ValueError:
+        return jsonify({'error': 'invalid since cursor'}), 400
+    limit = app.config['REPORTS_MAX_PAGE_SIZE']
+    settled = current_report_version()
+    if since_id is not None:
+        # Resume inside a version that was cut off by the page limit
+        changed = db.or_(Report.version > since_version,
+                         db.and_(Report.version == since_version, Report.id > since_id))
+    elif since_version > 0:
+        changed = Report.version > since_version
+    else:
+        # Reports from before change tracking all have version 0
+        changed = db.true()
+    reports = Report.query.options(db.joinedload(Report.responder)).filter(changed, Report.parent_id.is_(None)) \
+        .order_by(Report.version, Report.id).limit(limit).all()
+    changes = []
     for report in reports:
-        image_url = url_for('static', filename=f'uploads/{report.image_filename}') if report.image_filename else None
-        reports_list.append({'lat': report.latitude, 'lon': report.longitude, 'animal': report.animal_type,
-                             'condition': report.condition, 'desc': report.description,
-                             'time': report.timestamp.strftime('%Y-%m-%d %H:%M'), 'image_url': image_url,
-                             'status': report.status, 'ai_suggestion': report.ai_species_suggestion})
-    return jsonify(reports_list)
+        item = report_to_dict(report)
+        item['responder'] = report.responder.username if report.responder else None
+        item['responder_id'] = report.responder_id
+        changes.append(item)
+    if len(reports) == limit and (reports[-1].version <= settled or since_version >= settled):
+        cursor = f'{reports[-1].version}_{reports[-1].id}'
+    else:
+        # Never past a version that may still be committed
+        cursor = str(max(settled, since_version))
+    return jsonify({'reports': changes, 'cursor': cursor, 'has_more': len(reports) == limit})
+
+
+def encode_report_cursor(timestamp, report_id):
+    return f'{timestamp.isoformat()}_{report_id}'
+
+
+def decode_report_cursor(cursor):
+    timestamp, report_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(timestamp), int(report_id)
+
+
+def stream_report_list():
+    # Keyset pagination on (timestamp, id), newest first. Only the columns the
+    # client needs are selected and rows are written out as they are fetched,
+    # so memory stays flat however large the page or the table is.
+    try:
+        limit = min(max(int(request.args.get('limit', app.config['REPORTS_PAGE_SIZE'])), 1),
+                    app.config['REPORTS_MAX_PAGE_SIZE'])
+        cursor = decode_report_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'invalid limit or cursor'}), 400
+    ndjson = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best == 'application/x-ndjson'
+    # Read before the rows, so ?since= from here misses nothing listed after it
+    since = str(current_report_version())
+
+    def listed(model, archived):
+        return db.session.query(model.id, model.latitude, model.longitude, model.animal_type, model.condition,
+                                model.description, model.timestamp, model.image_filename, model.status,
+                                model.ai_species_suggestion, model.sighting_count,
+                                db.literal(archived).label('archived')).filter(model.parent_id.is_(None))
+
+    query = listed(Report, False)
+    if request.args.get('include_archived') in ('1', 'true'):
+        # Opt-in: the archive is merged in by (timestamp, id) like the hot rows
+        query = query.union_all(listed(ArchivedReport, True))
+    if cursor:
+        timestamp, report_id = cursor
+        query = query.filter(db.or_(Report.timestamp < timestamp,
+                                    db.and_(Report.timestamp == timestamp, Report.id < report_id)))
+    query = query.order_by(Report.timestamp.desc(), Report.id.desc()).limit(limit) \
+        .execution_options(yield_per=200)
+    upload_url = url_for('uploaded_file', filename='x').rsplit('/', 1)[0] + '/'
+    thumb_url = image_variant_url('x', 'thumb').rsplit('/', 1)[0] + '/'
+    archived_url = url_for('archived_upload', filename='x').rsplit('/', 1)[0] + '/'
+
+    def generate():
+        count, last = 0, None
+        yield '' if ndjson else '{"reports":['
+        for row in query:
+            image_url = None
+            if row.image_filename:
+                image_url = (archived_url if row.archived else upload_url) + row.image_filename
+            item = {'id': row.id, 'lat': row.latitude, 'lon': row.longitude, 'animal': row.animal_type,
+                    'condition': row.condition, 'desc': row.description,
+                    'time': row.timestamp.isoformat(' ', 'minutes'), 'image_url': image_url,
+                    'thumb_url': thumb_url + row.image_filename if row.image_filename and not row.archived else None,
+                    'status': row.status, 'ai_suggestion': row.ai_species_suggestion,
+                    'sightings': row.sighting_count or 0}
+            if row.archived:
+                item['archived'] = True
+            item = json.dumps(item)
+            if ndjson:
+                yield item + '\n'
+            else:
+                yield item if count == 0 else ',' + item
+            count, last = count + 1, row
+        next_cursor = encode_report_cursor(last.timestamp, last.id) if count == limit else None
+        if ndjson:
+            yield json.dumps({'next_cursor': next_cursor, 'since': since}) + '\n'
+        else:
+            yield '],"next_cursor":' + json.dumps(next_cursor) + ',"since":' + json.dumps(since) + '}'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson' if ndjson else 'application/json')
+
+
+def get_map_reports():
+    # Viewport query: ?bbox=west,south,east,north&zoom=N&status=New,Acknowledged
+    try:
+        west, south, east, north = [float(v) for v in request.args['bbox'].split(',')]
+        zoom = int(request.args.get('zoom', 0))
+    except ValueError:
+        return jsonify({'error': 'bbox must be west,south,east,north and zoom an integer'}), 400
+    statuses = [s for s in request.args.get('status', '').split(',') if s]
+    since = str(current_report_version())
+
+    filters = [Report.latitude.between(south, north), Report.parent_id.is_(None)]
+    if west <= east:
+        filters.append(Report.longitude.between(west, east))
+    else:
+        filters.append(db.or_(Report.longitude >= west, Report.longitude <= east))
+    if statuses:
+        filters.append(Report.status.in_(statuses))
+
+    if zoom > app.config['MAP_CLUSTER_MAX_ZOOM']:
+        reports = Report.query.filter(*filters).order_by(Report.timestamp.desc()) \
+            .limit(app.config['MAP_MAX_POINTS']).all()
+        return jsonify({'zoom': zoom, 'clusters': [], 'reports': [report_to_dict(report) for report in reports],
+                        'since': since})
+
+    precision = GEOHASH_PRECISION_BY_ZOOM[max(zoom, 0)]
+    cell = func.substr(Report.geohash, 1, precision)
+    rows = db.session.query(cell, func.count(Report.id), func.avg(Report.latitude), func.avg(Report.longitude)) \
+        .filter(*filters).group_by(cell).all()
+    clusters = [{'cell': c, 'count': count, 'lat': lat, 'lon': lon} for c, count, lat, lon in rows]
+    return jsonify({'zoom': zoom, 'clusters': clusters, 'reports': [], 'since': since})
+
+
+@app.route('/api/reports/bulk', methods=['POST'])
+@login_required
+def bulk_update_reports():
+    # {"operations": [{"action": "claim" | "reassign" | "resolve", "report_ids": [1, 2],
+    #                  "responder_id": 3, "resolution_notes": "..."}], "atomic": false}
+    # Every operation runs in one transaction; each report succeeds only if it
+    # was still in the expected status. With atomic=true any miss rolls back all.
+    if current_user.role != 'admin':
+        return jsonify({'error': 'admin access required'}), 403
+    payload = request.get_json(silent=True)
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return jsonify({'error': 'body must be {"operations": [{...}, ...]}'}), 400
+    try:
+        for op in operations:
+            if not isinstance(op.get('report_ids', []), list):
+                raise TypeError
+            op['report_ids'] = [int(report_id) for report_id in op.get('report_ids', [])]
+            if op.get('responder_id') is not None:
+                op['responder_id'] = int(op['responder_id'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'report_ids must be a list of integers and responder_id an integer'}), 400
+    if not operations or any(op.get('action') not in ('claim', 'reassign', 'resolve') or not op['report_ids']
+                             for op in operations):
+        return jsonify({'error': 'operations must each have an action (claim, reassign, resolve) and report_ids'}), 400
+    if sum(len(op['report_ids']) for op in operations) > app.config['BULK_MAX_REPORTS']:
+        return jsonify({'error': f"at most {app.config['BULK_MAX_REPORTS']} reports per request"}), 400
+
+    responder_ids = {op['responder_id'] for op in operations if op.get('responder_id')}
+    responders = {user.id: user for user in User.query.filter(User.id.in_(responder_ids),
+                                                              User.role.in_(['responder', 'admin']))}
+    if responder_ids - set(responders):
+        return jsonify({'error': 'responder_id must belong to a responder or admin'}), 400
+
+    results, changes = [], []
+    for op in operations:
+        action, report_ids = op['action'], op['report_ids']
+        responder = responders.get(op.get('responder_id'), current_user)
+        if action == 'claim':
+            rows = transition_reports(report_ids, 'New', {'status': 'Acknowledged', 'responder_id': responder.id})
+        elif action == 'reassign':
+            rows = transition_reports(report_ids, 'Acknowledged', {'responder_id': responder.id})
+        else:
+            values = {'status': 'Resolved', 'resolution_notes': op.get('resolution_notes', '')}
+            rows = transition_reports(report_ids, 'New', values) + transition_reports(report_ids, 'Acknowledged', values)
+        changed = {row.id for row in rows}
+        changes += [(op, responder, row) for row in rows]
+        results += [{'id': report_id, 'action': action, 'ok': report_id in changed} for report_id in report_ids]
+
+    failed = [result for result in results if not result['ok']]
+    if failed:
+        statuses = dict(db.session.query(Report.id, Report.status)
+                        .filter(Report.id.in_({result['id'] for result in failed})))
+        for result in failed:
+            status = statuses.get(result['id'])
+            result['error'] = f"report is {status}" if status else 'report not found'
+        if payload.get('atomic'):
+            db.session.rollback()
+            return jsonify({'committed': False, 'results': results}), 409
+
+    # Notifications and socket events for the whole batch go out once, after commit
+    events, assignments = [], {}
+    names = dict(db.session.query(User.id, User.username)
+                 .filter(User.id.in_({row.responder_id for _, _, row in changes if row.responder_id})))
+    for op, responder, row in changes:
+        if op['action'] == 'resolve':
+            if mail_enabled():
+                queue_resolved_email(row, names.get(row.responder_id, current_user.username),
+                                     op.get('resolution_notes', ''), None)
+            events.append(resolved_event(row))
+            continue
+        if mail_enabled():
+            if op['action'] == 'claim':
+                queue_claimed_email(row, responder.username)
+            if responder.id != current_user.id:
+                assignments.setdefault(responder.id, (responder, []))[1].append(row)
+        events.append(claimed_event(row, responder))
+    if mail_enabled():
+        for responder, rows in assignments.values():
+            queue_assignment_email(responder, rows)
+    db.session.commit()
+    if mail_enabled() and changes:
+        notification_queue.wake()
+    event_coalescer.publish_many(events)
+    return jsonify({'committed': True, 'results': results})
+
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest_reports():
+    partner = ingest_partner()
+    if partner is None:
+        return jsonify({'error': 'invalid or missing X-API-Key'}), 401
+    rows = ingest_rows()
+    if rows is None:
+        return jsonify({'error': 'send a JSON list of reports, {"reports": [...]}, or NDJSON'}), 400
+
+    results, created, chunk = [], [], []
+    for row, item in enumerate(rows, 1):
+        if row > app.config['INGEST_MAX_ROWS']:
+            results.append({'row': row, 'ok': False, 'error': f"batch limit of {app.config['INGEST_MAX_ROWS']} rows"})
+            break
+        values, error = parse_ingest_row(item)
+        if error:
+            results.append({'row': row, 'ok': False, 'error': error})
+            continue
+        chunk.append((row, values))
+        if len(chunk) >= app.config['INGEST_CHUNK_SIZE']:
+            created += ingest_chunk(chunk, results)
+            chunk = []
+    if chunk:
+        created += ingest_chunk(chunk, results)
+
+    if created:
+        notify_ingested_reports(created)
+    results.sort(key=lambda result: result['row'])
+    accepted = sum(1 for result in results if result['ok'])
+    print(f"Ingested {accepted} of {len(results)} reports from {partner}")
+    # Partial batches succeed; a batch with nothing usable is a bad request
+    status = 400 if results and not accepted else 200
+    return jsonify({'accepted': accepted, 'rejected': len(results) - accepted, 'results': results}), status
+
+
+EXPORT_COLUMNS = ['id', 'timestamp', 'status', 'animal_type', 'condition', 'description', 'latitude', 'longitude',
+                  'reporter_email', 'responder', 'ai_species_suggestion', 'claimed_at', 'resolved_at',
+                  'resolution_notes', 'parent_id', 'sighting_count']
+
+
+@app.route('/api/reports/search')
+@login_required
+def search_reports():
+    # ?q=injured leg&page=1&per_page=20&status=New,Acknowledged
+    # Ranked full-text matches in descriptions and resolution notes
+    terms = search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({'error': 'q is required'}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', app.config['SEARCH_PAGE_SIZE'], type=int), 1),
+                   app.config['SEARCH_MAX_PAGE_SIZE'])
+    matches = report_search(terms)
+    query = db.session.query(Report, matches.c.score).join(matches, matches.c.id == Report.id) \
+        .filter(Report.parent_id.is_(None))
+    statuses = [s for s in request.args.get('status', '').split(',') if s]
+    if statuses:
+        query = query.filter(Report.status.in_(statuses))
+    rows = query.order_by(matches.c.score.desc(), Report.id.desc()) \
+        .offset((page - 1) * per_page).limit(per_page + 1).all()
+    results = [dict(report_to_dict(report), score=score) for report, score in rows[:per_page]]
+    return jsonify({'results': results, 'page': page, 'per_page': per_page, 'has_more': len(rows) > per_page})
+
+
+@app.route('/api/reports/export')
+@login_required
+def export_reports():
+    # ?format=csv|ndjson&start=YYYY-MM-DD&end=YYYY-MM-DD&status=New,Resolved&animal_type=Dog&gzip=1
+    #  &include_archived=1&include_sightings=1
+    # Rows are fetched EXPORT_BATCH_SIZE at a time from a server-side cursor
+    # and written out as they arrive, so memory does not grow with the table.
+    if current_user.role != 'admin':
+        return jsonify({'error': 'admin access required'}), 403
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    def exported(model):
+        columns = [getattr(model, name) for name in EXPORT_COLUMNS if name != 'responder']
+        query = db.session.query(*columns, User.username.label('responder')) \
+            .outerjoin(User, model.responder_id == User.id)
+        if start:
+            query = query.filter(model.timestamp >= start)
+        if end:
+            # A bare date includes the whole day
+            query = query.filter(model.timestamp < (end + timedelta(days=1) if len(request.args['end']) == 10 else end))
+        for name in ('status', 'animal_type'):
+            values = [v for v in request.args.get(name, '').split(',') if v]
+            if values:
+                query = query.filter(getattr(model, name).in_(values))
+        if request.args.get('include_sightings') not in ('1', 'true'):
+            query = query.filter(model.parent_id.is_(None))
+        return query
+
+    query = exported(Report)
+    if request.args.get('include_archived') in ('1', 'true'):
+        query = query.union_all(exported(ArchivedReport))
+    query = query.order_by(Report.timestamp, Report.id).execution_options(yield_per=app.config['EXPORT_BATCH_SIZE'])
+
+    def rows():
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for count, row in enumerate(query, 1):
+                writer.writerow([getattr(row, name) for name in EXPORT_COLUMNS])
+                if count % app.config['EXPORT_BATCH_SIZE'] == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for row in query:
+                yield json.dumps({name: getattr(row, name) for name in EXPORT_COLUMNS}, default=str) + '\n'
+
+    def generate():
+        if not compress:
+            yield from rows()
+            return
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        for chunk in rows():
+            compressed = compressor.compress(chunk.encode())
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    filename = f"reports-{date.today().isoformat()}.{export_format}" + ('.gz' if compress else '')
+    mimetype = 'application/gzip' if compress else 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -298,9 +2212,20 @@ def register():
             user_role = 'admin'
         else:
             user_role = request.form.get('role', 'responder')
-        hashed_password = bcrypt.generate_password_hash(request.form['password']).decode('utf-8')
+        try:
+            service_area = [float(request.form[name]) if request.form.get(name, '').strip() else None
+                            for name in ('service_latitude', 'service_longitude', 'service_radius_km')]
+            error = service_area_error(*service_area)
+        except ValueError:
+            error = 'Service area values must be numbers.'
+        if error:
+            flash(error, 'danger')
+            return render_template('register.html'), 400
+        hashed_password = hash_password(request.form['password'])
         new_user = User(username=request.form['username'], email=request.form['email'], 
-                       password_hash=hashed_password, role=user_role)
+                       password_hash=hashed_password, role=user_role,
+                       service_latitude=service_area[0], service_longitude=service_area[1],
+                       service_radius_km=service_area[2])
         db.session.add(new_user)
         db.session.commit()
         flash('Account created! You can now log in.', 'success')
@@ -313,7 +2238,7 @@ def login():
     if current_user.is_authenticated: return redirect(url_for('dashboard'))
     if request.method == 'POST':
         user = User.query.filter_by(username=request.form['username']).first()
-        if user and bcrypt.check_password_hash(user.password_hash, request.form['password']):
+        if user and check_password(user, request.form['password']):
             login_user(user, remember=True)
             flash(f'Welcome back, {user.username}!', 'success')
             next_page = request.args.get('next')
@@ -333,52 +2258,49 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    reports = Report.query.order_by(Report.timestamp.desc()).all()
-    return render_template('dashboard.html', reports=reports)
+    status = request.args.get('status', '')
+    scope = request.args.get('scope', 'all')
+    window = request.args.get('window', 'all')
+    page = request.args.get('page', 1, type=int)
+
+    def render():
+        # Cursor for catching up on changes missed while the socket was down
+        since = current_report_version()
+        pagination = dashboard_query(status, scope, window, current_user.id) \
+            .paginate(page=page, per_page=app.config['DASHBOARD_PAGE_SIZE'], error_out=False)
+
+        # Live rows are only prepended on the first page of a view that shows new reports
+        live_updates = pagination.page == 1 and status in ('', 'New') and scope != 'mine'
+        filters = {'status': status, 'scope': scope, 'window': window}
+        return render_template('dashboard.html', reports=pagination.items, pagination=pagination, filters=filters,
+                               live_updates=live_updates, since=since)
+
+    # Pending flash messages must be shown, so they always get a fresh page
+    if session.get('_flashes'):
+        return render()
+    # A time window drops old reports as the clock moves, not only on changes
+    minute = datetime.utcnow().strftime('%Y-%m-%d %H:%M') if DASHBOARD_WINDOWS.get(window) else ''
+    return conditional_response(report_etag(current_user.id, current_user.role, minute), render)
 
 
 @app.route('/report/<int:report_id>/claim', methods=['POST'])
 @login_required
 def claim_report(report_id):
-    report = Report.query.get_or_404(report_id)
-    if report.status == 'New':
-        report.responder_id = current_user.id
-        report.status = 'Acknowledged'
+    claimed = transition_reports([report_id], 'New', {'status': 'Acknowledged', 'responder_id': current_user.id})
+    if claimed:
+        report = claimed[0]
+        if mail_enabled():
+            queue_claimed_email(report, current_user.username)
         db.session.commit()
-        
-        # Send email to reporter
-        if app.config['MAIL_USERNAME'] and app.config['MAIL_PASSWORD']:
-            try:
-                map_link = f"https://www.google.com/maps?q={report.latitude},{report.longitude}"
-                msg = Message(
-                    subject='👍 Report Claimed - WARRN',
-                    sender=app.config['MAIL_USERNAME'],
-                    recipients=[report.reporter_email]
-                )
-                msg.body = f"""Good news! Your report has been claimed by a responder.
+        if mail_enabled():
+            notification_queue.wake()
+        event_coalescer.publish(*claimed_event(report, current_user))
 
-Report Details:
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📋 Report ID: #{report.id}
-🐾 Animal Type: {report.animal_type}
-⚠️  Condition: {report.condition}
-📍 Location: {map_link}
-👤 Responder: {current_user.username}
-✅ Status: Acknowledged
-
-A responder is now working on this incident.
-You will be notified when it is resolved.
-
-Thank you for your patience! 🙏
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-WARRN - Wildlife Animal Rescue & Response Network
-"""
-                mail.send(msg)
-            except Exception as e:
-                print(f"Email Error: {e}")
-        
         flash('You have claimed this report.', 'success')
     else:
+        db.session.rollback()
+        if db.session.get(Report, report_id) is None:
+            abort(404)
         flash('This report has already been claimed.', 'warning')
     return redirect(url_for('dashboard'))
 
@@ -396,6 +2318,10 @@ def resolve_report(report_id):
             return redirect(url_for('dashboard'))
     
     if report.responder_id == current_user.id:
+        if report.status != 'Resolved':
+            report.resolved_at = datetime.utcnow()
+            record_status_change(report, report.status, 'Resolved')
+            record_latency('resolve', report.timestamp, report.resolved_at)
         report.status = 'Resolved'
         report.resolution_notes = request.form.get('resolution_notes', '')
         
@@ -403,54 +2329,17 @@ def resolve_report(report_id):
         if 'resolution_image' in request.files:
             file = request.files['resolution_image']
             if file and file.filename != '' and allowed_file(file.filename):
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                unique_id = uuid.uuid4().hex
-                filename = secure_filename(f"resolved_{unique_id}.{ext}")
-                image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(image_path)
-                report.resolution_image = filename
+                report.resolution_image = save_upload(file, prefix='resolved_')
         
+        if mail_enabled():
+            queue_resolved_email(report, current_user.username, report.resolution_notes, report.resolution_image)
         db.session.commit()
-        
-        # Send email to reporter with resolution details
-        if app.config['MAIL_USERNAME'] and app.config['MAIL_PASSWORD']:
-            try:
-                map_link = f"https://www.google.com/maps?q={report.latitude},{report.longitude}"
-                msg = Message(
-                    subject='✅ Report Resolved - WARRN',
-                    sender=app.config['MAIL_USERNAME'],
-                    recipients=[report.reporter_email]
-                )
-                resolution_text = f'📝 Resolution Notes:\n{report.resolution_notes}\n\n' if report.resolution_notes else ''
-                msg.body = f"""Great news! Your report has been resolved.
+        if mail_enabled():
+            notification_queue.wake()
+        event_coalescer.publish(*resolved_event(report))
+        if report.resolution_image:
+            classification_pool.submit(report.resolution_image)
 
-Report Details:
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📋 Report ID: #{report.id}
-🐾 Animal Type: {report.animal_type}
-⚠️  Condition: {report.condition}
-📍 Location: {map_link}
-👤 Responder: {current_user.username}
-✅ Status: *** RESOLVED ***
-
-{resolution_text}The incident has been successfully handled.
-Thank you for reporting and helping save an animal's life!
-
-Your compassion makes a difference. ❤️
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-WARRN - Wildlife Animal Rescue & Response Network
-"""
-                # Attach resolution image if exists
-                if report.resolution_image:
-                    image_path = os.path.join(app.config['UPLOAD_FOLDER'], report.resolution_image)
-                    if os.path.exists(image_path):
-                        with open(image_path, 'rb') as img:
-                            msg.attach(report.resolution_image, 'image/jpeg', img.read())
-                
-                mail.send(msg)
-            except Exception as e:
-                print(f"Email Error: {e}")
-        
         flash('Report has been marked as resolved and reporter notified.', 'success')
     else:
         flash('You cannot resolve a report you have not claimed.', 'danger')
@@ -464,16 +2353,155 @@ def analytics():
         flash('You must be an admin to access this page.', 'danger')
         return redirect(url_for('dashboard'))
 
-    total_reports = Report.query.count()
-    reports_by_status = db.session.query(Report.status, func.count(Report.status)).group_by(Report.status).all()
+    reports_by_status = db.session.query(ReportRollup.status, func.sum(ReportRollup.count)) \
+        .group_by(ReportRollup.status).all()
     status_counts = {status: count for status, count in reports_by_status}
-    reports_by_animal = db.session.query(Report.animal_type, func.count(Report.animal_type)).group_by(
-        Report.animal_type).order_by(func.count(Report.animal_type).desc()).all()
+    total_reports = sum(status_counts.values())
+    animal_total = func.sum(ReportRollup.count)
+    reports_by_animal = db.session.query(ReportRollup.animal_type, animal_total).group_by(
+        ReportRollup.animal_type).having(animal_total > 0).order_by(animal_total.desc()).all()
     animal_labels = [item[0] for item in reports_by_animal]
     animal_data = [item[1] for item in reports_by_animal]
 
+    # Time series for the last 30 days
+    start = date.today() - timedelta(days=29)
+    per_day = dict(db.session.query(ReportRollup.day, func.sum(ReportRollup.count))
+                   .filter(ReportRollup.day >= start).group_by(ReportRollup.day).all())
+    day_labels = [(start + timedelta(days=i)).isoformat() for i in range(30)]
+    day_data = [per_day.get(start + timedelta(days=i), 0) for i in range(30)]
+    median_claim_minutes = median_latency('claim', start)
+    median_resolve_minutes = median_latency('resolve', start)
+
+    # Every month with heatmap data, for the time slider
+    first, last = db.session.query(func.min(HeatmapCell.month), func.max(HeatmapCell.month)) \
+        .filter(HeatmapCell.zoom == HEATMAP_CELL_ZOOMS[0]).one()
+    heatmap_months = []
+    while first and first <= last:
+        heatmap_months.append(first.strftime('%Y-%m'))
+        first = (first + timedelta(days=32)).replace(day=1)
+
     return render_template('analytics.html', total_reports=total_reports, status_counts=status_counts,
-                           animal_labels=animal_labels, animal_data=animal_data)
+                           animal_labels=animal_labels, animal_data=animal_data, day_labels=day_labels,
+                           day_data=day_data, median_claim_minutes=median_claim_minutes,
+                           median_resolve_minutes=median_resolve_minutes, heatmap_months=heatmap_months)
+
+
+# --- Heatmap Tiles ---
+# A map tile is drawn from the heatmap cells HEATMAP_TILE_DETAIL zoom levels
+# below it (a 16x16 grid), for every month in the requested range at once so
+# the time slider never refetches. Payloads are kept in an LRU cache keyed by
+# the tile's version: the newest change to the coarse cells covering it in
+# the requested months, so a report only invalidates the tiles around it.
+HEATMAP_TILE_DETAIL = 4
+
+
+class TileCache:
+    def __init__(self, app):
+        self.app = app
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._tiles.get(key)
+            if payload is not None:
+                self._tiles.move_to_end(key)
+        HEATMAP_TILE_CACHE.inc(result='miss' if payload is None else 'hit')
+        return payload
+
+    def put(self, key, payload):
+        with self._lock:
+            self._tiles[key] = payload
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.app.config['HEATMAP_CACHE_SIZE']:
+                self._tiles.popitem(last=False)
+
+
+tile_cache = TileCache(app)
+
+
+def parse_month(value):
+    return datetime.strptime(value, '%Y-%m').date() if value else None
+
+
+def month_range(query, start, end):
+    if start:
+        query = query.filter(HeatmapCell.month >= start)
+    if end:
+        query = query.filter(HeatmapCell.month <= end)
+    return query
+
+
+def heatmap_tile_version(zoom, x, y, start, end):
+    # Every change stamps one cell per zoom in HEATMAP_CELL_ZOOMS, so the
+    # cell containing the tile at the nearest cell zoom not finer than the
+    # tile sees it (or the cells inside a tile coarser than any cell zoom)
+    cell_zoom = max((z for z in HEATMAP_CELL_ZOOMS if z <= zoom), default=HEATMAP_CELL_ZOOMS[0])
+    if cell_zoom <= zoom:
+        shift = zoom - cell_zoom
+        x_range, y_range = (x >> shift, x >> shift), (y >> shift, y >> shift)
+    else:
+        shift = cell_zoom - zoom
+        x_range, y_range = (x << shift, ((x + 1) << shift) - 1), (y << shift, ((y + 1) << shift) - 1)
+    query = db.session.query(func.max(HeatmapCell.version)) \
+        .filter(HeatmapCell.zoom == cell_zoom, HeatmapCell.x.between(*x_range), HeatmapCell.y.between(*y_range))
+    return month_range(query, start, end).scalar() or 0
+
+
+def build_heatmap_tile(zoom, x, y, start, end):
+    cell_zoom = next((z for z in HEATMAP_CELL_ZOOMS if z >= zoom + HEATMAP_TILE_DETAIL), HEATMAP_CELL_ZOOMS[-1])
+    shift = cell_zoom - zoom
+    query = db.session.query(HeatmapCell.x, HeatmapCell.y, HeatmapCell.month, HeatmapCell.count) \
+        .filter(HeatmapCell.zoom == cell_zoom, HeatmapCell.x.between(x << shift, ((x + 1) << shift) - 1),
+                HeatmapCell.y.between(y << shift, ((y + 1) << shift) - 1), HeatmapCell.count > 0)
+    rows = month_range(query, start, end).all()
+    months = sorted({month for _, _, month, _ in rows})
+    index = {month: i for i, month in enumerate(months)}
+    cells = [[cell_x - (x << shift), cell_y - (y << shift), index[month], count]
+             for cell_x, cell_y, month, count in rows]
+    return json.dumps({'size': 1 << shift, 'months': [month.strftime('%Y-%m') for month in months],
+                       'cells': cells}, separators=(',', ':'))
+
+
+@app.route('/api/heatmap/<int:zoom>/<int:x>/<int:y>')
+@login_required
+def heatmap_tile(zoom, x, y):
+    # ?from=YYYY-MM&to=YYYY-MM
+    # {"size": 16, "months": ["2025-01", ...], "cells": [[dx, dy, month index, count], ...]}
+    # dx, dy count cells from the tile's top-left corner.
+    if current_user.role != 'admin':
+        return jsonify({'error': 'admin access required'}), 403
+    if zoom > HEATMAP_CELL_ZOOMS[-1] or not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+        return jsonify({'error': 'no such tile'}), 404
+    try:
+        start, end = parse_month(request.args.get('from')), parse_month(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM'}), 400
+    version = heatmap_tile_version(zoom, x, y, start, end)
+    key = (version, zoom, x, y, start, end)
+
+    def render():
+        payload = tile_cache.get(key)
+        if payload is None:
+            payload = build_heatmap_tile(zoom, x, y, start, end)
+            tile_cache.put(key, payload)
+        return Response(payload, mimetype='application/json')
+
+    etag = hashlib.sha1('|'.join(str(part) for part in key).encode()).hexdigest()[:16]
+    return conditional_response(etag, render)
+
+
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    provided = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    scraper = bool(token and provided and hmac.compare_digest(provided, token))
+    if not scraper and not (current_user.is_authenticated and current_user.role == 'admin'):
+        return jsonify({'error': 'admin access required'}), 403
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
 
 
 # --- Main Execution ---
@@ -482,4 +2510,5 @@ if __name__ == '__main__':
         instance_path = os.path.join(basedir, 'instance')
         os.makedirs(instance_path, exist_ok=True)
         db.create_all()
+    start_background_workers()
     socketio.run(app, debug=True)
\ No newline at end of file
@@ -0,0 +1,80 @@
+import os
+import time
+import shutil
+import argparse
+from datetime import datetime, timedelta
+from config import IMAGE_VARIANTS
+from models import create_app, db, Report, OutboundEmail, archive_batch
+
+# Moves resolved reports nobody has touched for ARCHIVE_AFTER_DAYS out of the
+# report table into archived_report, so listings, indexes and caches only
+# cover the working set. Each batch is its own short transaction. Run it
+# daily; it picks up where it stopped and is safe to interrupt.
+#
+#   python archive_reports.py                  archive with the configured age
+#   python archive_reports.py --days 30        override ARCHIVE_AFTER_DAYS
+#   python archive_reports.py --move-images    also retire their uploads
+#
+# Uploads are stored by content hash and can be shared between reports, so
+# an image only moves to ARCHIVE_IMAGE_FOLDER once no hot report and no
+# unsent email uses it. --move-images must run where static/uploads lives.
+
+
+def images_in_use():
+    in_use = set()
+    for column in (Report.image_filename, Report.resolution_image):
+        in_use.update(name for (name,) in db.session.query(column).filter(column.isnot(None))
+                      .execution_options(yield_per=1000))
+    in_use.update(name for (name,) in db.session.query(OutboundEmail.attachment)
+                  .filter(OutboundEmail.attachment.isnot(None), OutboundEmail.status != 'sent'))
+    return in_use
+
+
+def move_images(filenames, upload_folder, cold_folder):
+    os.makedirs(cold_folder, exist_ok=True)
+    in_use = images_in_use()
+    moved = []
+    for filename in sorted(set(filenames) - in_use):
+        source = os.path.join(upload_folder, filename)
+        if not os.path.exists(source):
+            continue
+        shutil.move(source, os.path.join(cold_folder, filename))
+        # Resized variants are regenerated on demand, so they are just dropped
+        for variant in IMAGE_VARIANTS:
+            variant_path = os.path.join(upload_folder, variant, filename.rsplit('.', 1)[0] + '.jpg')
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+        moved.append(filename)
+    # The same photo may have been uploaded again while it was being moved
+    db.session.rollback()
+    restored = set(moved) & images_in_use()
+    for filename in restored:
+        shutil.copy2(os.path.join(cold_folder, filename), os.path.join(upload_folder, filename))
+    return len(moved) - len(restored)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive old resolved reports')
+    parser.add_argument('--days', type=int, help='archive reports resolved more than this many days ago')
+    parser.add_argument('--batch-size', type=int, help='reports moved per transaction')
+    parser.add_argument('--move-images', action='store_true', help='move unused uploads to ARCHIVE_IMAGE_FOLDER')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        days = args.days if args.days is not None else app.config['ARCHIVE_AFTER_DAYS']
+        batch_size = args.batch_size or app.config['ARCHIVE_BATCH_SIZE']
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        archived, images = 0, []
+        while True:
+            batch = archive_batch(cutoff, batch_size)
+            if not batch:
+                break
+            archived += len(batch)
+            images.extend(name for _, image, resolution_image in batch for name in (image, resolution_image) if name)
+            print(f"Archived {archived} reports")
+            time.sleep(app.config['ARCHIVE_BATCH_PAUSE'])
+        print(f"Archived {archived} reports resolved before {cutoff:%Y-%m-%d}")
+        if args.move_images and images:
+            moved = move_images(images, app.config['UPLOAD_FOLDER'], app.config['ARCHIVE_IMAGE_FOLDER'])
+            print(f"Moved {moved} images to {app.config['ARCHIVE_IMAGE_FOLDER']}")
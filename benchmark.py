@@ -0,0 +1,404 @@
+import os
+import io
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+# Load test for the main WARRN endpoints. It seeds a database, replaces SMTP
+# and Google Vision with local fakes, drives each scenario through Flask's
+# test client at the requested concurrency, and records throughput and
+# latency percentiles as JSON. Two result files can be compared to catch
+# regressions before deploying.
+#
+#   python benchmark.py run --reports 20000 --requests 300 --concurrency 8 --output after.json
+#   python benchmark.py compare before.json after.json --threshold 15
+#   python benchmark.py startup --runs 10 --output startup.json
+#
+# Without --database a throwaway SQLite file is used. Never point --database
+# at production: the benchmark writes users, reports and emails.
+
+SCENARIOS = ['submit_report', 'api_reports', 'api_reports_bbox', 'dashboard', 'analytics', 'claim', 'resolve',
+             'socket_fanout']
+ANIMALS = ['Dog', 'Cat', 'Cow', 'Bird', 'Monkey', 'Snake']
+CONDITIONS = ['Injured', 'Injured-Immobile', 'Sick', 'Trapped', 'Deceased']
+PASSWORD = 'benchmark'
+
+# Runs in a fresh interpreter for every startup sample
+STARTUP_PROBE = '''
+import sys, json, time
+module = sys.argv[1]
+started = time.perf_counter()
+loaded = __import__(module)
+timings = {'import_' + module: time.perf_counter() - started}
+if module == 'app':
+    client = loaded.app.test_client()
+    for name, path in (('first_request_index', '/'), ('first_request_api', '/api/reports')):
+        started = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        timings[name] = time.perf_counter() - started if response.status_code == 200 else None
+print(json.dumps(timings))
+'''
+
+
+def configure_environment(args, workdir):
+    # Must run before app is imported: the app reads its config at import time
+    database = args.database
+    if not database:
+        # mode=rw: a background worker that polls while the work directory is
+        # being removed gets an error instead of creating the file again
+        database_path = os.path.join(workdir, 'bench.db')
+        open(database_path, 'a').close()
+        database = f'sqlite:///file:{database_path}?mode=rw&uri=true'
+    os.environ['DATABASE_URL'] = database
+    # Benchmark uploads must not land in the real static/uploads
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    os.makedirs(os.environ['UPLOAD_FOLDER'])
+    os.environ['CLASSIFIER_BACKEND'] = 'stub'
+    os.environ['MAIL_USERNAME'] = 'benchmark@example.com'
+    os.environ['MAIL_PASSWORD'] = 'benchmark'
+    os.environ['SOCKETIO_COALESCE_WINDOW'] = '0'
+    os.environ.pop('SOCKETIO_MESSAGE_QUEUE', None)
+    return database
+
+
+def seed(warrn, args, rng):
+    from models import rebuild_rollups
+    app, db = warrn.app, warrn.db
+    with app.app_context():
+        db.create_all()
+        password_hash = warrn.bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+        users = [warrn.User(username='bench_admin', email='bench_admin@example.com', password_hash=password_hash,
+                            role='admin')]
+        for i in range(args.users):
+            users.append(warrn.User(username=f'bench_responder_{i}', email=f'bench_responder_{i}@example.com',
+                                    password_hash=password_hash, role='responder',
+                                    service_latitude=rng.uniform(8, 30), service_longitude=rng.uniform(70, 88),
+                                    service_radius_km=rng.choice([25, 50, 100])))
+        db.session.add_all(users)
+        db.session.commit()
+
+        now = datetime.utcnow()
+        for start in range(0, args.reports, 1000):
+            rows = []
+            for _ in range(min(1000, args.reports - start)):
+                rows.append({'latitude': rng.uniform(8, 30), 'longitude': rng.uniform(70, 88),
+                             'animal_type': rng.choice(ANIMALS), 'condition': rng.choice(CONDITIONS),
+                             'description': 'Seeded by benchmark.py', 'reporter_email': 'reporter@example.com',
+                             'timestamp': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))})
+            warrn.insert_report_rows(rows)
+        rebuild_rollups()
+        return [user.username for user in users[1:]]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {'requests': len(values) + errors, 'errors': errors, 'seconds': round(elapsed, 3),
+            'throughput_rps': round(len(values) / elapsed, 2) if elapsed else None,
+            'mean_ms': round(sum(values) / len(values) * 1000, 2) if values else None,
+            'p50_ms': round(percentile(values, 50) * 1000, 2) if values else None,
+            'p95_ms': round(percentile(values, 95) * 1000, 2) if values else None,
+            'p99_ms': round(percentile(values, 99) * 1000, 2) if values else None,
+            'max_ms': round(values[-1] * 1000, 2) if values else None}
+
+
+class Harness:
+    def __init__(self, warrn, responders, args, rng):
+        self.warrn = warrn
+        self.app = warrn.app
+        self.responders = responders
+        self.args = args
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.sockets = []
+        with self.app.app_context():
+            self.unclaimed = [row[0] for row in self.warrn.db.session.query(self.warrn.Report.id)
+                              .filter(self.warrn.Report.status == 'New')
+                              .order_by(self.warrn.Report.id.desc()).limit(args.requests * 2)]
+        # Clients log in once, up front, so logins are never measured. A
+        # worker checks one out per request; each remembers what it claimed.
+        self.clients = queue.Queue()
+        for i in range(args.concurrency):
+            self.clients.put(self.login(responders[i % len(responders)]))
+        self.admins = queue.Queue()
+        for _ in range(args.concurrency):
+            self.admins.put(self.login('bench_admin'))
+
+    def login(self, username):
+        client = self.app.test_client()
+        client.post('/login', data={'username': username, 'password': PASSWORD})
+        client.claimed = []
+        return client
+
+    def image(self):
+        from PIL import Image
+        with self.lock:
+            color = tuple(self.rng.randint(0, 255) for _ in range(3))
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), color).save(buffer, 'JPEG')
+        buffer.seek(0)
+        return buffer
+
+    def connect_sockets(self):
+        # Half the sockets are responder dashboards, half zoomed-out public maps
+        for i in range(self.args.sockets):
+            if i % 2 == 0:
+                client = self.app.test_client()
+                client.post('/login', data={'username': self.responders[i % len(self.responders)],
+                                            'password': PASSWORD})
+                socket = self.warrn.socketio.test_client(self.app, flask_test_client=client)
+            else:
+                socket = self.warrn.socketio.test_client(self.app)
+                socket.emit('watch_map', {'bbox': [60, 0, 100, 40]})
+            self.sockets.append(socket)
+
+    def run_scenario(self, name, client):
+        # Returns True if the request succeeded
+        if name == 'submit_report':
+            with self.lock:
+                latitude, longitude = self.rng.uniform(8, 30), self.rng.uniform(70, 88)
+            data = {'latitude': str(latitude), 'longitude': str(longitude), 'animal_type': 'Dog',
+                    'condition': 'Injured', 'description': 'benchmark', 'reporter_email': 'reporter@example.com',
+                    'image': (self.image(), 'bench.jpg')}
+            return client.post('/report', data=data, content_type='multipart/form-data').status_code == 302
+        if name == 'api_reports':
+            return client.get('/api/reports?limit=100').status_code == 200
+        if name == 'api_reports_bbox':
+            with self.lock:
+                west, south, zoom = self.rng.uniform(70, 85), self.rng.uniform(8, 27), self.rng.randint(5, 14)
+            return client.get(f'/api/reports?bbox={west},{south},{west + 3},{south + 3}&zoom={zoom}').status_code == 200
+        if name == 'dashboard':
+            with self.lock:
+                query = self.rng.choice(['', '?status=New', '?scope=mine', '?scope=unclaimed&window=7d', '?page=3'])
+            return client.get('/dashboard' + query).status_code == 200
+        if name == 'analytics':
+            return client.get('/analytics').status_code == 200
+        if name == 'claim':
+            with self.lock:
+                if not self.unclaimed:
+                    return False
+                report_id = self.unclaimed.pop()
+            if client.post(f'/report/{report_id}/claim').status_code != 302:
+                return False
+            client.claimed.append(report_id)
+            return True
+        if name == 'resolve':
+            if not client.claimed:
+                return False
+            response = client.post(f'/report/{client.claimed.pop()}/resolve', data={'resolution_notes': 'benchmark'})
+            return response.status_code == 302
+        if name == 'socket_fanout':
+            with self.lock:
+                latitude, longitude = self.rng.uniform(8, 30), self.rng.uniform(70, 88)
+            with self.app.test_request_context():
+                report = self.warrn.Report(id=0, latitude=latitude, longitude=longitude, animal_type='Dog',
+                                           condition='Injured', timestamp=datetime.utcnow(), status='New',
+                                           geohash=self.warrn.geohash_encode(latitude, longitude))
+                self.warrn.event_coalescer.publish('new_report', self.warrn.report_to_dict(report),
+                                                   self.warrn.report_rooms(report))
+            return True
+        raise ValueError(name)
+
+    def measure(self, name):
+        pool = self.admins if name == 'analytics' else self.clients
+        requests = self.args.requests
+        if name == 'resolve':
+            # One entry per claimed report, so each request gets the
+            # responder that claimed it
+            pool = queue.Queue()
+            for client in list(self.clients.queue):
+                for _ in client.claimed:
+                    pool.put(client)
+            requests = min(requests, pool.qsize())
+        latencies, errors = [], []
+
+        def one(measured):
+            client = pool.get()
+            started = time.perf_counter()
+            try:
+                ok = self.run_scenario(name, client)
+            except Exception as e:
+                print(f"   {name} error: {e}")
+                ok = False
+            finally:
+                pool.put(client)
+            if measured:
+                with self.lock:
+                    (latencies if ok else errors).append(time.perf_counter() - started)
+
+        # claim and resolve change state, so every request counts
+        if name not in ('claim', 'resolve'):
+            for _ in range(self.args.warmup):
+                one(False)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            list(executor.map(one, [True] * requests))
+        elapsed = time.perf_counter() - started
+        for socket in self.sockets:
+            socket.queue = []
+        return summarize(latencies, len(errors), elapsed)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args, workdir):
+    database = configure_environment(args, workdir)
+    import app as warrn
+    warrn.app.config['MAIL_SUPPRESS_SEND'] = True
+    rng = random.Random(args.seed)
+
+    print(f"Seeding {args.reports} reports and {args.users} responders into {database.split('@')[-1]}")
+    started = time.perf_counter()
+    responders = seed(warrn, args, rng)
+    print(f"   seeded in {time.perf_counter() - started:.1f}s")
+
+    harness = Harness(warrn, responders, args, rng)
+    scenarios = args.scenarios.split(',') if args.scenarios else SCENARIOS
+    if 'socket_fanout' in scenarios:
+        harness.connect_sockets()
+
+    with warrn.app.app_context():
+        dialect = warrn.db.engine.dialect.name
+    results = {'meta': {'revision': git_revision(), 'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+                        'database': dialect, 'python': platform.python_version(),
+                        'reports': args.reports, 'users': args.users, 'requests': args.requests,
+                        'concurrency': args.concurrency, 'sockets': args.sockets, 'seed': args.seed},
+               'scenarios': {}}
+    for name in scenarios:
+        print(f"Running {name} ({args.requests} requests, concurrency {args.concurrency})")
+        summary = harness.measure(name)
+        results['scenarios'][name] = summary
+        print(f"   {summary['throughput_rps']} req/s  p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms  "
+              f"p99 {summary['p99_ms']} ms  errors {summary['errors']}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+    # Let the mail workers send what the scenarios queued, then close the
+    # pooled connections so the SQLite file can be removed
+    with warrn.app.app_context():
+        pending = warrn.OutboundEmail.query.filter(warrn.OutboundEmail.status.in_(['queued', 'sending']))
+        deadline = time.monotonic() + 30
+        while pending.count() and time.monotonic() < deadline:
+            time.sleep(0.2)
+        warrn.db.session.remove()
+        warrn.db.engine.dispose()
+
+
+def startup(args, workdir):
+    # Cold-start cost, one fresh interpreter per sample: importing models
+    # (what the scripts load), importing app (a web worker booting) and the
+    # app's first requests. `python -X importtime -c "import app"` breaks an
+    # import down by module.
+    configure_environment(args, workdir)
+    root = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run([sys.executable, '-c', 'from models import create_app, db\napp = create_app()\n'
+                    'with app.app_context():\n    db.create_all()'], cwd=root, check=True)
+    samples = {}
+    for _ in range(args.runs):
+        for module in ('models', 'app'):
+            output = subprocess.run([sys.executable, '-c', STARTUP_PROBE, module], cwd=root, check=True,
+                                    capture_output=True, text=True).stdout
+            for name, seconds in json.loads(output.splitlines()[-1]).items():
+                samples.setdefault(name, []).append(seconds)
+
+    results = {'meta': {'revision': git_revision(), 'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+                        'python': platform.python_version(), 'runs': args.runs},
+               'scenarios': {}}
+    for name, values in samples.items():
+        timings = [value for value in values if value is not None]
+        summary = summarize(timings, len(values) - len(timings), sum(timings))
+        results['scenarios'][name] = summary
+        print(f"{name:<22} p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms  max {summary['max_ms']} ms  "
+              f"errors {summary['errors']}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"Baseline {baseline['meta'].get('revision')} vs candidate {candidate['meta'].get('revision')}\n")
+    print(f"{'scenario':<18}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}{'req/s':>18}")
+    regressions = []
+    for name, new in candidate['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if not old:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            if old[key] is None or new[key] is None:
+                cells.append(f"{'n/a':>18}")
+                continue
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f"{old[key]:>7} → {new[key]:<7}{change:+4.0f}%")
+            # Latency going up or throughput going down beyond the threshold is a regression
+            worse = change if key != 'throughput_rps' else -change
+            if key in ('p95_ms', 'throughput_rps') and worse > args.threshold:
+                regressions.append(f"{name} {key} {change:+.0f}%")
+        print(f"{name:<18}" + ''.join(cells))
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold}%: " + ', '.join(regressions))
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold}%.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='WARRN load test and benchmark')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='seed a database and measure every scenario')
+    run_parser.add_argument('--database', help='SQLAlchemy URL (default: a temporary SQLite file)')
+    run_parser.add_argument('--reports', type=int, default=10000, help='reports to seed')
+    run_parser.add_argument('--users', type=int, default=50, help='responders to seed')
+    run_parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    run_parser.add_argument('--concurrency', type=int, default=4, help='concurrent clients')
+    run_parser.add_argument('--sockets', type=int, default=50, help='connected Socket.IO clients for fan-out')
+    run_parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per scenario')
+    run_parser.add_argument('--scenarios', help='comma-separated subset of: ' + ', '.join(SCENARIOS))
+    run_parser.add_argument('--seed', type=int, default=42, help='random seed for reproducible data')
+    run_parser.add_argument('--output', default='benchmark-results.json', help='where to save the JSON results')
+    startup_parser = commands.add_parser('startup', help='measure import time and first-request latency')
+    startup_parser.add_argument('--database', help='SQLAlchemy URL (default: a temporary SQLite file)')
+    startup_parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to sample')
+    startup_parser.add_argument('--output', default='startup-results.json', help='where to save the JSON results')
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=20.0,
+                                help='percent change in p95 latency or throughput that counts as a regression')
+    args = parser.parse_args()
+    if args.command == 'compare':
+        compare(args)
+    else:
+        # The throwaway SQLite file and uploads are removed however the run ends
+        with tempfile.TemporaryDirectory(prefix='warrn-bench-') as workdir:
+            if args.command == 'run':
+                run(args, workdir)
+            else:
+                startup(args, workdir)
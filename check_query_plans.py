@@ -0,0 +1,78 @@
+import sys
+from datetime import datetime, date, timedelta
+from sqlalchemy import func
+from app import app, db, Report, ReportRollup, HeatmapCell, dashboard_query, report_search
+
+# Prints the query plan of each hot-path query and checks that it uses the
+# expected index. Exits non-zero if any of them falls back to a table scan.
+# Postgres prefers sequential scans on small tables, so they are disabled
+# for the check; run it after migrate_database.py against any database.
+
+
+def hot_path_queries():
+    day_ago = datetime.utcnow() - timedelta(hours=24)
+    return [
+        ('Dashboard, status filter', ['ix_report_status_timestamp'],
+         dashboard_query(status='New').limit(20)),
+        ('Dashboard, my reports', ['ix_report_responder_timestamp'],
+         dashboard_query(scope='mine', user_id=1).limit(20)),
+        ('Dashboard, unclaimed', ['ix_report_responder_timestamp'],
+         dashboard_query(scope='unclaimed').limit(20)),
+        ('Dashboard, last 24 hours', ['ix_report_timestamp_id'],
+         dashboard_query(window='24h').limit(20)),
+        ('API list, keyset page', ['ix_report_timestamp_id'],
+         db.session.query(Report.id).filter(db.or_(Report.timestamp < day_ago,
+                                                   db.and_(Report.timestamp == day_ago, Report.id < 100)))
+         .order_by(Report.timestamp.desc(), Report.id.desc()).limit(100)),
+        ('API delta feed', ['ix_report_version'],
+         db.session.query(Report.id).filter(Report.version > 10).order_by(Report.version, Report.id).limit(100)),
+        ('Map viewport', ['ix_report_lat_lon'],
+         db.session.query(Report.id).filter(Report.latitude.between(12.0, 13.0),
+                                            Report.longitude.between(77.0, 78.0))),
+        ('Admin, animal filter', ['ix_report_animal_type_timestamp'],
+         db.session.query(Report.id).filter(Report.animal_type == 'Dog').order_by(Report.timestamp.desc())
+         .limit(20)),
+        ('Admin, reporter email search', ['ix_report_reporter_email'],
+         db.session.query(Report.id).filter(Report.reporter_email >= 'asha@',
+                                            Report.reporter_email < 'asha@' + '\U0010ffff')),
+        ('Analytics, daily series', ['report_rollup_pkey', 'sqlite_autoindex_report_rollup_1'],
+         db.session.query(ReportRollup.day, func.sum(ReportRollup.count))
+         .filter(ReportRollup.day >= date.today() - timedelta(days=29)).group_by(ReportRollup.day)),
+        ('Full-text search', ['ix_report_search', 'VIRTUAL TABLE INDEX'],
+         db.session.query(report_search(['injured', 'leg']))),
+        ('Heatmap tile', ['heatmap_cell_pkey', 'sqlite_autoindex_heatmap_cell_1'],
+         db.session.query(HeatmapCell.x, HeatmapCell.y, HeatmapCell.month, HeatmapCell.count)
+         .filter(HeatmapCell.zoom == 10, HeatmapCell.x.between(704, 735), HeatmapCell.y.between(448, 479))),
+        ('Heatmap tile version', ['heatmap_cell_pkey', 'sqlite_autoindex_heatmap_cell_1'],
+         db.session.query(func.max(HeatmapCell.version))
+         .filter(HeatmapCell.zoom == 4, HeatmapCell.x.between(11, 11), HeatmapCell.y.between(7, 7))),
+    ]
+
+
+def explain(connection, query):
+    compiled = query.statement.compile(dialect=connection.dialect)
+    sql = str(compiled)
+    params = compiled.construct_params()
+    if connection.dialect.name == 'postgresql':
+        return [row[0] for row in connection.exec_driver_sql('EXPLAIN ' + sql, params)]
+    params = tuple(params[name] for name in compiled.positiontup)
+    return [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+if __name__ == '__main__':
+    failures = 0
+    with app.app_context():
+        with db.engine.connect() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.exec_driver_sql('SET enable_seqscan = off')
+            for name, indexes, query in hot_path_queries():
+                plan = explain(connection, query)
+                used = any(index in line for line in plan for index in indexes)
+                failures += not used
+                print(f"[{'ok' if used else 'FAIL'}] {name} (expects {' or '.join(indexes)})")
+                for line in plan:
+                    print(f"       {line}")
+    if failures:
+        print(f"\n{failures} queries are not using their index. Run: python migrate_database.py")
+        sys.exit(1)
+    print("\nAll hot-path queries use an index.")
@@ -0,0 +1,128 @@
+import os
+from datetime import timedelta
+
+# Settings for the web app and the scripts, read from the environment.
+# render.yaml holds the production values.
+basedir = os.path.abspath(os.path.dirname(__file__))
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+IMAGE_VARIANTS = {'thumb': 200, 'medium': 800}
+DASHBOARD_WINDOWS = {'24h': timedelta(hours=24), '7d': timedelta(days=7), '30d': timedelta(days=30), 'all': None}
+
+
+def configure(app):
+    app.config['SECRET_KEY'] = 'a-very-secret-key-you-should-change'
+
+    # --- Authentication Configuration ---
+    # Raising BCRYPT_LOG_ROUNDS upgrades existing hashes as users log in.
+    # USER_CACHE_TTL is how long (seconds) a logged-in user's row is reused
+    # between requests; 0 loads it from the database every time.
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 30))
+
+    # --- Database Configuration ---
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'instance/reports.db'))
+    if database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # --- File Upload Configuration ---
+    # Served by the /uploads routes, so it can live outside static/ (benchmark.py
+    # points it at a throwaway directory)
+    app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(basedir, 'static/uploads'))
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('UPLOAD_MAX_MB', 10)) * 1024 * 1024
+
+    # --- Image Classification Configuration ---
+    app.config['CLASSIFIER_BACKEND'] = os.environ.get('CLASSIFIER_BACKEND', 'vision')
+    app.config['CLASSIFIER_WORKERS'] = int(os.environ.get('CLASSIFIER_WORKERS', 2))
+    app.config['CLASSIFIER_QUEUE_SIZE'] = int(os.environ.get('CLASSIFIER_QUEUE_SIZE', 100))
+    app.config['STUB_CLASSIFIER_LABELS'] = os.environ.get('STUB_CLASSIFIER_LABELS', 'Dog,Mammal')
+    app.config['CLASSIFIER_BATCH_SIZE'] = min(int(os.environ.get('CLASSIFIER_BATCH_SIZE', 8)), 16)
+    app.config['CLASSIFIER_BATCH_WINDOW'] = float(os.environ.get('CLASSIFIER_BATCH_WINDOW', 0.5))
+    app.config['CLASSIFICATION_CACHE_TTL_DAYS'] = int(os.environ.get('CLASSIFICATION_CACHE_TTL_DAYS', 30))
+    app.config['CLASSIFICATION_CACHE_MAX_ENTRIES'] = int(os.environ.get('CLASSIFICATION_CACHE_MAX_ENTRIES', 5000))
+
+    # --- Map Configuration ---
+    app.config['MAP_CLUSTER_MAX_ZOOM'] = int(os.environ.get('MAP_CLUSTER_MAX_ZOOM', 12))
+    app.config['MAP_MAX_POINTS'] = int(os.environ.get('MAP_MAX_POINTS', 500))
+    # Heatmap tiles kept per worker, least recently used dropped first
+    app.config['HEATMAP_CACHE_SIZE'] = int(os.environ.get('HEATMAP_CACHE_SIZE', 2048))
+    app.config['REPORTS_PAGE_SIZE'] = int(os.environ.get('REPORTS_PAGE_SIZE', 500))
+    app.config['REPORTS_MAX_PAGE_SIZE'] = int(os.environ.get('REPORTS_MAX_PAGE_SIZE', 5000))
+    app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+    # Postgres only: changes younger than this are re-sent by the ?since= feed,
+    # in case a transaction holding an older report version has not committed
+    app.config['REPORT_VERSION_SETTLE_SECONDS'] = float(os.environ.get('REPORT_VERSION_SETTLE_SECONDS', 5))
+
+    # --- Responder Targeting Configuration ---
+    app.config['RESPONDER_DEFAULT_RADIUS_KM'] = float(os.environ.get('RESPONDER_DEFAULT_RADIUS_KM', 25))
+    app.config['RESPONDER_MAX_RADIUS_KM'] = float(os.environ.get('RESPONDER_MAX_RADIUS_KM', 200))
+    app.config['NOTIFY_RESPONDERS_WITHOUT_AREA'] = os.environ.get('NOTIFY_RESPONDERS_WITHOUT_AREA', 'true').lower() == 'true'
+
+    # --- Duplicate Detection Configuration ---
+    # A report of the same animal this close to an open incident, filed within
+    # the window, becomes a sighting of it. DEDUP_RADIUS_M=0 turns this off.
+    app.config['DEDUP_RADIUS_M'] = float(os.environ.get('DEDUP_RADIUS_M', 100))
+    app.config['DEDUP_WINDOW_MINUTES'] = int(os.environ.get('DEDUP_WINDOW_MINUTES', 60))
+
+    # --- Dashboard Configuration ---
+    app.config['DASHBOARD_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_PAGE_SIZE', 25))
+    app.config['BULK_MAX_REPORTS'] = int(os.environ.get('BULK_MAX_REPORTS', 500))
+    app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+    app.config['SEARCH_MAX_PAGE_SIZE'] = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', 100))
+
+    # --- Archive Configuration ---
+    # archive_reports.py moves resolved reports untouched for ARCHIVE_AFTER_DAYS
+    # into archived_report, ARCHIVE_BATCH_SIZE per transaction with a pause of
+    # ARCHIVE_BATCH_PAUSE seconds between batches. With --move-images, uploads
+    # no hot report uses any more go to ARCHIVE_IMAGE_FOLDER, outside static/.
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+    app.config['ARCHIVE_BATCH_PAUSE'] = float(os.environ.get('ARCHIVE_BATCH_PAUSE', 0.5))
+    app.config['ARCHIVE_IMAGE_FOLDER'] = os.environ.get('ARCHIVE_IMAGE_FOLDER', os.path.join(basedir, 'archive/uploads'))
+
+    # --- Ingestion Configuration ---
+    # INGEST_API_KEYS is a comma-separated list of partner:key pairs
+    app.config['INGEST_API_KEYS'] = [k.strip() for k in os.environ.get('INGEST_API_KEYS', '').split(',') if k.strip()]
+    app.config['INGEST_MAX_ROWS'] = int(os.environ.get('INGEST_MAX_ROWS', 5000))
+    app.config['INGEST_CHUNK_SIZE'] = int(os.environ.get('INGEST_CHUNK_SIZE', 200))
+
+    # --- Email Configuration ---
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_USE_SSL'] = False
+    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+    app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_USERNAME')
+    app.config['MAIL_MAX_EMAILS'] = None
+    app.config['MAIL_ASCII_ATTACHMENTS'] = False
+    app.config['MAIL_WORKERS'] = int(os.environ.get('MAIL_WORKERS', 2))
+    app.config['MAIL_MAX_ATTEMPTS'] = int(os.environ.get('MAIL_MAX_ATTEMPTS', 5))
+    app.config['MAIL_RETRY_BACKOFF'] = int(os.environ.get('MAIL_RETRY_BACKOFF', 30))
+    app.config['MAIL_SEND_LEASE'] = int(os.environ.get('MAIL_SEND_LEASE', 300))
+    app.config['MAIL_POLL_INTERVAL'] = int(os.environ.get('MAIL_POLL_INTERVAL', 15))
+
+    # --- Real-time Configuration ---
+    # With more than one worker, SOCKETIO_MESSAGE_QUEUE points every process at a
+    # shared broker (e.g. redis://...) so an emit in one worker reaches clients
+    # connected to all of them. 'local://' relays between Socket.IO servers in
+    # one process, which is how tests/ covers that path without a broker
+    # (Flask-SocketIO's test client cannot be used with any message queue).
+    # Load balancers without sticky sessions need SOCKETIO_WEBSOCKET_ONLY, since
+    # long-polling requests must keep hitting the same worker.
+    app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    app.config['SOCKETIO_CHANNEL'] = os.environ.get('SOCKETIO_CHANNEL', 'warrn-socketio')
+    app.config['SOCKETIO_WEBSOCKET_ONLY'] = os.environ.get('SOCKETIO_WEBSOCKET_ONLY', 'false').lower() == 'true'
+    app.config['SOCKETIO_COALESCE_WINDOW'] = float(os.environ.get('SOCKETIO_COALESCE_WINDOW', 0.25))
+    app.config['MAP_TILE_PRECISION'] = int(os.environ.get('MAP_TILE_PRECISION', 3))
+    app.config['MAP_TILE_ROOM_LIMIT'] = int(os.environ.get('MAP_TILE_ROOM_LIMIT', 64))
+
+    # --- Instrumentation Configuration ---
+    # SLOW_REQUEST_MS > 0 logs every request slower than that, with its SQL cost.
+    # A request running the same statement N_PLUS_ONE_THRESHOLD times is flagged
+    # as a likely N+1 query. METRICS_TOKEN lets a Prometheus scraper read
+    # /metrics with an "Authorization: Bearer" header instead of an admin login.
+    app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 0))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
@@ -1,5 +1,9 @@
 import os
-from app import app, db, User, bcrypt
+from flask_bcrypt import Bcrypt
+from models import create_app, db, User
+
+app = create_app()
+bcrypt = Bcrypt(app)
 
 with app.app_context():
     username = input("Enter admin username: ")
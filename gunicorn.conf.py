@@ -0,0 +1,7 @@
+# Read by gunicorn from the working directory, whatever the start command.
+
+
+def post_worker_init(worker):
+    # Each worker starts its mail queue as it boots, not on its first request
+    from app import start_background_workers
+    start_background_workers()
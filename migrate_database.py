@@ -1,27 +1,235 @@
 import os
-import shutil
+import sys
 from datetime import datetime
+from sqlalchemy import inspect, text
+from config import basedir
+from models import create_app, db, Report, geohash_encode, rebuild_rollups, rebuild_heatmap, create_search_index
 
-# Backup existing database
-basedir = os.path.abspath(os.path.dirname(__file__))
-db_path = os.path.join(basedir, 'instance', 'reports.db')
+# Versioned, non-destructive schema migrations for SQLite and Postgres.
+# Each migration runs once, in order, and is recorded in schema_migrations.
+# Steps only add tables, columns and indexes, checking first, so they are
+# also safe on databases that were set up by the old add_*_fields scripts.
+#
+#   python migrate_database.py           apply pending migrations
+#   python migrate_database.py --status  list applied and pending migrations
 
-if os.path.exists(db_path):
-    backup_path = os.path.join(basedir, 'instance', f'reports_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db')
-    shutil.copy2(db_path, backup_path)
-    print(f"Database backed up to: {backup_path}")
-    os.remove(db_path)
-    print("Old database removed")
 
-# Create new database with updated schema
-from app import app, db
+def column_names(table):
+    return [column['name'] for column in inspect(db.engine).get_columns(table)]
 
-with app.app_context():
+
+def add_column(table, column, ddl_type):
+    if column in column_names(table):
+        print(f"   {table}.{column} already exists")
+        return
+    quoted = db.engine.dialect.identifier_preparer.quote(table)
+    db.session.execute(text(f"ALTER TABLE {quoted} ADD COLUMN {column} {ddl_type}"))
+    print(f"   Added {table}.{column}")
+
+
+def create_index(name, table, columns, where=None):
+    quoted = db.engine.dialect.identifier_preparer.quote(table)
+    condition = f" WHERE {where}" if where else ""
+    db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {quoted} ({columns}){condition}"))
+    print(f"   Index {name} on {table} ({columns})")
+
+
+def create_tables():
+    # Creates tables that do not exist yet; never alters existing ones
+    db.session.commit()
     db.create_all()
-    print("New database created with updated schema!")
-    print("\nChanges made:")
-    print("   - Added 'email' field to User model")
-    print("   - Added 'reporter_email' field to Report model")
-    print("   - Role selection now available during registration")
-    print("\nNote: You need to re-register all users!")
-    print("   Run: python create_admin.py to create admin user")
+
+
+def migration_baseline():
+    create_tables()
+
+
+def migration_early_fields():
+    # Columns added before migrations were versioned. Accounts and reports
+    # from that time keep a NULL email address.
+    add_column('user', 'email', 'VARCHAR(120)')
+    add_column('report', 'reporter_email', 'VARCHAR(120)')
+    add_column('report', 'ai_species_suggestion', 'VARCHAR(50)')
+    add_column('report', 'resolution_notes', 'VARCHAR(500)')
+    add_column('report', 'resolution_image', 'VARCHAR(100)')
+    quoted = db.engine.dialect.identifier_preparer.quote('user')
+    db.session.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ix_user_email ON {quoted} (email)"))
+
+
+def migration_geohash():
+    add_column('report', 'geohash', 'VARCHAR(12)')
+    create_index('ix_report_geohash', 'report', 'geohash')
+    create_index('ix_report_lat_lon', 'report', 'latitude, longitude')
+    updated = 0
+    while True:
+        rows = db.session.query(Report.id, Report.latitude, Report.longitude) \
+            .filter(Report.geohash.is_(None)).limit(500).all()
+        if not rows:
+            break
+        for report_id, latitude, longitude in rows:
+            db.session.execute(text("UPDATE report SET geohash = :geohash WHERE id = :id"),
+                               {'geohash': geohash_encode(latitude, longitude), 'id': report_id})
+        updated += len(rows)
+    print(f"   Backfilled geohash for {updated} reports")
+
+
+def migration_keyset_index():
+    create_index('ix_report_timestamp_id', 'report', 'timestamp, id')
+
+
+def migration_change_tracking():
+    add_column('report', 'version', 'INTEGER')
+    add_column('report', 'updated_at', 'TIMESTAMP')
+    create_index('ix_report_version', 'report', 'version')
+    # Existing reports predate change tracking: version 0, last updated when filed
+    db.session.execute(text("UPDATE report SET version = 0 WHERE version IS NULL"))
+    db.session.execute(text("UPDATE report SET updated_at = timestamp WHERE updated_at IS NULL"))
+    create_tables()
+
+
+def migration_rollups():
+    add_column('report', 'claimed_at', 'TIMESTAMP')
+    add_column('report', 'resolved_at', 'TIMESTAMP')
+    create_tables()
+    # Sightings (parent_id) and the archive only arrive in later migrations,
+    # so every report counts here
+    rows = db.session.query(Report.timestamp, Report.status, Report.animal_type, Report.condition,
+                            Report.claimed_at, Report.resolved_at).execution_options(yield_per=1000)
+    report_rows, latency_rows = rebuild_rollups(rows)
+    print(f"   Rebuilt analytics rollups: {report_rows} report counters, {latency_rows} latency buckets")
+
+
+def migration_service_areas():
+    for column in ['service_latitude', 'service_longitude', 'service_radius_km']:
+        add_column('user', column, 'FLOAT')
+    create_index('ix_user_service_area', 'user', 'service_latitude, service_longitude')
+
+
+def migration_report_indexes():
+    # Dashboard/admin status filters, "my reports" and unclaimed views, and
+    # admin animal filters, all ordered newest first
+    create_index('ix_report_status_timestamp', 'report', 'status, timestamp, id')
+    create_index('ix_report_responder_timestamp', 'report', 'responder_id, timestamp, id')
+    create_index('ix_report_animal_type_timestamp', 'report', 'animal_type, timestamp')
+
+
+def migration_full_text_search():
+    connection = db.session.connection()
+    create_search_index(connection)
+    if connection.dialect.name != 'postgresql':
+        # Index the reports that existed before the FTS table
+        connection.exec_driver_sql("INSERT INTO report_fts (report_fts) VALUES ('rebuild')")
+    print("   Full-text index on report description and resolution notes")
+
+
+def migration_sightings():
+    add_column('report', 'parent_id', 'INTEGER REFERENCES report (id) ON DELETE SET NULL')
+    add_column('report', 'sighting_count', 'INTEGER NOT NULL DEFAULT 0')
+    create_index('ix_report_parent_id', 'report', 'parent_id', where='parent_id IS NOT NULL')
+
+
+def migration_archive():
+    create_tables()
+    print("   Created archived_report")
+
+
+def migration_heatmap():
+    create_tables()
+    print(f"   Built heatmap aggregates: {rebuild_heatmap()} cells")
+
+
+def migration_reporter_email_index():
+    # Admin search matches an email or its start
+    create_index('ix_report_reporter_email', 'report', 'reporter_email')
+
+
+def migration_heatmap_versions():
+    add_column('heatmap_cell', 'version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def migration_report_version_sequence():
+    # Postgres takes report versions from a sequence, carrying on from the counter
+    if db.engine.dialect.name != 'postgresql':
+        print("   Not needed on SQLite")
+        return
+    create_tables()
+    version = db.session.execute(text("SELECT GREATEST((SELECT MAX(version) FROM report), "
+                                      "(SELECT version FROM table_version WHERE name = 'report'))")).scalar()
+    if version:
+        db.session.execute(text("SELECT setval('report_version_seq', :version)"), {'version': version})
+    print(f"   report_version_seq continues after {version or 0}")
+
+
+MIGRATIONS = [
+    (1, 'Baseline schema', migration_baseline),
+    (2, 'Emails, AI suggestion and resolution fields', migration_early_fields),
+    (3, 'Report geohash and map indexes', migration_geohash),
+    (4, 'Keyset pagination index', migration_keyset_index),
+    (5, 'Report change tracking', migration_change_tracking),
+    (6, 'Analytics rollups', migration_rollups),
+    (7, 'Responder service areas', migration_service_areas),
+    (8, 'Hot-path report indexes', migration_report_indexes),
+    (9, 'Full-text search index', migration_full_text_search),
+    (10, 'Duplicate sightings', migration_sightings),
+    (11, 'Report archive', migration_archive),
+    (12, 'Heatmap aggregates', migration_heatmap),
+    (13, 'Reporter email index', migration_reporter_email_index),
+    (14, 'Heatmap cell versions', migration_heatmap_versions),
+    (15, 'Report version sequence', migration_report_version_sequence),
+]
+
+
+def applied_versions():
+    db.session.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations "
+                            "(version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)"))
+    db.session.commit()
+    return {row[0] for row in db.session.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_pending():
+    applied = applied_versions()
+    pending = [m for m in MIGRATIONS if m[0] not in applied]
+    if not pending:
+        print("Database schema is up to date.")
+    for version, description, step in pending:
+        print(f"Applying migration {version}: {description}")
+        try:
+            step()
+            db.session.execute(text("INSERT INTO schema_migrations (version, description, applied_at) "
+                                    "VALUES (:version, :description, :applied_at)"),
+                               {'version': version, 'description': description, 'applied_at': datetime.utcnow()})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            print(f"Migration {version} failed; later migrations were not applied.")
+            raise
+
+
+def migrate():
+    if db.engine.dialect.name != 'postgresql':
+        os.makedirs(os.path.join(basedir, 'instance'), exist_ok=True)
+        run_pending()
+        return
+    # Instances starting together must not run the same migration twice. The
+    # advisory lock belongs to this connection, so it is held until the end.
+    with db.engine.connect() as lock:
+        lock.execute(text("SELECT pg_advisory_lock(4207013)"))
+        try:
+            run_pending()
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(4207013)"))
+
+
+def show_status():
+    applied = applied_versions()
+    for version, description, _ in MIGRATIONS:
+        print(f"[{'x' if version in applied else ' '}] {version}: {description}")
+
+
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        if '--status' in sys.argv:
+            show_status()
+        else:
+            migrate()
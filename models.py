@@ -0,0 +1,499 @@
+import math
+from datetime import datetime, timedelta
+from flask import Flask, current_app
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from sqlalchemy import func, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from config import basedir, configure
+
+# Models and the schema logic that travels with them (change tracking,
+# rollups, archiving, geohash, the search index). Nothing here imports the
+# web app, so scripts can load the database without the routes, admin or
+# Socket.IO.
+db = SQLAlchemy()
+
+
+def create_app():
+    # Configuration and database only; app.py builds the web app on top
+    app = Flask('app', root_path=basedir)
+    configure(app)
+    db.init_app(app)
+    return app
+
+
+# --- Database Models ---
+class User(db.Model, UserMixin):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(128), nullable=False)
+    role = db.Column(db.String(20), nullable=False, default='responder')
+    service_latitude = db.Column(db.Float, nullable=True)
+    service_longitude = db.Column(db.Float, nullable=True)
+    service_radius_km = db.Column(db.Float, nullable=True)
+    reports = db.relationship('Report', backref='responder', lazy=True)
+
+    __table_args__ = (db.Index('ix_user_service_area', 'service_latitude', 'service_longitude'),)
+
+
+class Report(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    animal_type = db.Column(db.String(50), nullable=False)
+    condition = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.String(200), nullable=True)
+    reporter_email = db.Column(db.String(120), nullable=False)
+    image_filename = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='New')
+    responder_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    ai_species_suggestion = db.Column(db.String(50), nullable=True)
+    resolution_notes = db.Column(db.String(500), nullable=True)
+    resolution_image = db.Column(db.String(100), nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    geohash = db.Column(db.String(12), nullable=True, index=True)
+    version = db.Column(db.Integer, nullable=True, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+    # Follow-up reports of an open incident point at it and are not listed
+    # on their own; the incident counts them
+    parent_id = db.Column(db.Integer, db.ForeignKey('report.id', ondelete='SET NULL'), nullable=True)
+    sighting_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Composite indexes follow the listing queries: an equality filter first,
+    # then (timestamp, id) so newest-first pages are read straight off the index.
+    __table_args__ = (db.Index('ix_report_lat_lon', 'latitude', 'longitude'),
+                      db.Index('ix_report_timestamp_id', 'timestamp', 'id'),
+                      db.Index('ix_report_status_timestamp', 'status', 'timestamp', 'id'),
+                      db.Index('ix_report_responder_timestamp', 'responder_id', 'timestamp', 'id'),
+                      db.Index('ix_report_animal_type_timestamp', 'animal_type', 'timestamp'),
+                      db.Index('ix_report_reporter_email', 'reporter_email'),
+                      # Sightings only: list queries filter on parent_id IS NULL
+                      # and should keep using the indexes above
+                      db.Index('ix_report_parent_id', 'parent_id', sqlite_where=text('parent_id IS NOT NULL'),
+                               postgresql_where=text('parent_id IS NOT NULL')))
+
+
+class ArchivedReport(db.Model):
+    # Resolved reports moved out of report by archive_reports.py, with the
+    # same columns and ids. Only opt-in views and rollup rebuilds read it.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    animal_type = db.Column(db.String(50), nullable=False)
+    condition = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.String(200), nullable=True)
+    reporter_email = db.Column(db.String(120), nullable=False)
+    image_filename = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    responder_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    ai_species_suggestion = db.Column(db.String(50), nullable=True)
+    resolution_notes = db.Column(db.String(500), nullable=True)
+    resolution_image = db.Column(db.String(100), nullable=True)
+    timestamp = db.Column(db.DateTime)
+    geohash = db.Column(db.String(12), nullable=True)
+    version = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+    parent_id = db.Column(db.Integer, nullable=True)
+    sighting_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    responder = db.relationship('User')
+
+    __table_args__ = (db.Index('ix_archived_report_timestamp_id', 'timestamp', 'id'),)
+
+
+class ReportRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    animal_type = db.Column(db.String(50), primary_key=True)
+    condition = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class LatencyRollup(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(20), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class HeatmapCell(db.Model):
+    zoom = db.Column(db.Integer, primary_key=True)
+    x = db.Column(db.Integer, primary_key=True)
+    y = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    # Heatmap table version of the last change to this cell
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TableVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# --- Change Tracking ---
+# Every flush that inserts or modifies reports takes a new report version and
+# stamps it on the changed rows. The version is the ETag for the report
+# endpoints and the cursor for the ?since= delta feed. On Postgres versions
+# come from a sequence, so concurrent writers never queue on one counter row;
+# SQLite only has one writer at a time and keeps the counter in table_version.
+REPORT_VERSION_SEQUENCE = db.Sequence('report_version_seq', metadata=db.metadata)
+
+
+def next_table_version(session, name):
+    connection = session.connection()
+    version = connection.execute(TableVersion.__table__.update().where(TableVersion.name == name)
+                                 .values(version=TableVersion.version + 1).returning(TableVersion.version)).scalar()
+    if version is None:
+        connection.execute(TableVersion.__table__.insert().values(name=name, version=1))
+        version = 1
+    return version
+
+
+def current_table_version(name):
+    return db.session.execute(db.select(TableVersion.version).where(TableVersion.name == name)).scalar() or 0
+
+
+def next_report_version(session):
+    if session.connection().dialect.name == 'postgresql':
+        return session.execute(REPORT_VERSION_SEQUENCE.next_value()).scalar()
+    return next_table_version(session, 'report')
+
+
+def current_report_version():
+    # The ?since= cursor: every change up to this version is visible. Sequence
+    # values are taken in order but committed in any order, so on Postgres it
+    # stops before versions taken in the last REPORT_VERSION_SETTLE_SECONDS,
+    # whose transactions may still be open; clients just see those again.
+    if db.session.connection().dialect.name != 'postgresql':
+        return current_table_version('report')
+    settled = datetime.utcnow() - timedelta(seconds=current_app.config['REPORT_VERSION_SETTLE_SECONDS'])
+    return db.session.query(func.max(Report.version)).filter(Report.updated_at < settled).scalar() or 0
+
+
+def latest_report_version():
+    # Newest version taken, committed or not, for ETags: changes with every write
+    if db.session.connection().dialect.name != 'postgresql':
+        return current_table_version('report')
+    return db.session.execute(text("SELECT last_value FROM report_version_seq")).scalar()
+
+
+@db.event.listens_for(Session, 'before_flush')
+def stamp_report_versions(session, flush_context, instances):
+    changed = [obj for obj in session.new if isinstance(obj, Report)] + \
+              [obj for obj in session.dirty if isinstance(obj, Report) and session.is_modified(obj)]
+    if not changed:
+        return
+    version = next_report_version(session)
+    now = datetime.utcnow()
+    for report in changed:
+        report.version = version
+        report.updated_at = now
+
+
+# --- Analytics Rollups ---
+# Counters maintained in the same transaction as the report change they
+# describe, so analytics never has to scan the report table. ReportRollup
+# counts reports by the day they were filed and their current status;
+# LatencyRollup is a histogram of minutes from filing to claim/resolution.
+LATENCY_BUCKETS = [0, 5, 10, 15, 30, 45, 60, 90, 120, 180, 240, 360, 480, 720, 1440, 2880, 4320, 10080, 20160, 43200]
+
+
+def bump_rollup(model, delta=1, **keys):
+    if model.query.filter_by(**keys).update({'count': model.count + delta}, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(count=delta, **keys))
+    except IntegrityError:
+        # Another transaction created the row first
+        model.query.filter_by(**keys).update({'count': model.count + delta}, synchronize_session=False)
+
+
+def record_status_change(report, old_status, new_status):
+    keys = {'day': (report.timestamp or datetime.utcnow()).date(), 'animal_type': report.animal_type,
+            'condition': report.condition}
+    if old_status:
+        bump_rollup(ReportRollup, -1, status=old_status, **keys)
+    if new_status:
+        bump_rollup(ReportRollup, 1, status=new_status, **keys)
+
+
+def latency_bucket(minutes):
+    bucket = LATENCY_BUCKETS[0]
+    for bound in LATENCY_BUCKETS:
+        if minutes < bound:
+            break
+        bucket = bound
+    return bucket
+
+
+def record_latency(metric, started, finished):
+    minutes = max((finished - started).total_seconds() / 60, 0)
+    bump_rollup(LatencyRollup, 1, day=finished.date(), metric=metric, bucket=latency_bucket(minutes))
+
+
+# Report columns the rollup rows are keyed on, in rollup_keys() order
+ROLLUP_COLUMNS = ('timestamp', 'status', 'animal_type', 'condition', 'claimed_at', 'resolved_at')
+
+
+def rollup_keys(timestamp, status, animal_type, condition, claimed_at, resolved_at):
+    # (model, keys) of every rollup row one report is counted in
+    timestamp = timestamp or datetime.utcnow()
+    keys = [(ReportRollup, (('day', timestamp.date()), ('status', status), ('animal_type', animal_type),
+                            ('condition', condition)))]
+    for metric, finished in (('claim', claimed_at), ('resolve', resolved_at)):
+        if finished:
+            minutes = max((finished - timestamp).total_seconds() / 60, 0)
+            keys.append((LatencyRollup, (('day', finished.date()), ('metric', metric),
+                                         ('bucket', latency_bucket(minutes)))))
+    return keys
+
+
+def record_rollup_change(old, new):
+    # old, new: ROLLUP_COLUMNS values before and after an edit, None when
+    # the report was not (or is no longer) counted
+    old_keys = rollup_keys(*old) if old else []
+    new_keys = rollup_keys(*new) if new else []
+    for model, keys in old_keys:
+        if (model, keys) not in new_keys:
+            bump_rollup(model, -1, **dict(keys))
+    for model, keys in new_keys:
+        if (model, keys) not in old_keys:
+            bump_rollup(model, 1, **dict(keys))
+
+
+def median_latency(metric, since=None):
+    query = db.session.query(LatencyRollup.bucket, func.sum(LatencyRollup.count)) \
+        .filter(LatencyRollup.metric == metric)
+    if since:
+        query = query.filter(LatencyRollup.day >= since)
+    histogram = query.group_by(LatencyRollup.bucket).order_by(LatencyRollup.bucket).all()
+    total = sum(count for _, count in histogram)
+    seen = 0
+    for bucket, count in histogram:
+        seen += count
+        if seen * 2 >= total:
+            # Upper bound of the bucket holding the median
+            index = LATENCY_BUCKETS.index(bucket)
+            return LATENCY_BUCKETS[index + 1] if index + 1 < len(LATENCY_BUCKETS) else bucket
+    return None
+
+
+def rebuild_rollups(rows=None):
+    # rows: (timestamp, status, animal_type, condition, claimed_at, resolved_at)
+    # tuples; migrations pass their own query that only reads columns which
+    # exist at that point of the upgrade
+    ReportRollup.query.delete()
+    LatencyRollup.query.delete()
+    counts = {ReportRollup: {}, LatencyRollup: {}}
+    if rows is None:
+        # Archived reports still count towards analytics
+        rows = db.session.query(Report.timestamp, Report.status, Report.animal_type, Report.condition,
+                                Report.claimed_at, Report.resolved_at).filter(Report.parent_id.is_(None)) \
+            .union_all(db.session.query(ArchivedReport.timestamp, ArchivedReport.status, ArchivedReport.animal_type,
+                                        ArchivedReport.condition, ArchivedReport.claimed_at,
+                                        ArchivedReport.resolved_at)
+                       .filter(ArchivedReport.parent_id.is_(None))) \
+            .execution_options(yield_per=1000)
+    for row in rows:
+        for model, keys in rollup_keys(*row):
+            counts[model][keys] = counts[model].get(keys, 0) + 1
+    for model, rollup in counts.items():
+        db.session.bulk_insert_mappings(model, [dict(keys, count=count) for keys, count in rollup.items()])
+    db.session.commit()
+    return len(counts[ReportRollup]), len(counts[LatencyRollup])
+
+
+# --- Heatmap ---
+# Incident counts per map cell and month, kept for each zoom in
+# HEATMAP_CELL_ZOOMS. Cells are slippy-map tiles (2^zoom a side), so a map
+# tile is answered from the finer cells inside it without touching report.
+# Sightings are not counted, as in the rollups. Every change stamps the
+# cells it touches with a new heatmap version, so a tile's version is the
+# newest one among the cells covering it.
+HEATMAP_CELL_ZOOMS = [4, 6, 8, 10, 12, 14, 16]
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def tile_xy(latitude, longitude, zoom):
+    n = 2 ** zoom
+    latitude = max(min(latitude, MAX_MERCATOR_LATITUDE), -MAX_MERCATOR_LATITUDE)
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def heatmap_keys(latitude, longitude, timestamp):
+    month = timestamp.date().replace(day=1)
+    for zoom in HEATMAP_CELL_ZOOMS:
+        x, y = tile_xy(float(latitude), float(longitude), zoom)
+        yield zoom, x, y, month
+
+
+def record_heatmap(points, delta=1):
+    # points: (latitude, longitude, timestamp) of reports added (or removed)
+    counts = {}
+    for latitude, longitude, timestamp in points:
+        for key in heatmap_keys(latitude, longitude, timestamp or datetime.utcnow()):
+            counts[key] = counts.get(key, 0) + delta
+    if not counts:
+        return
+    # One upsert for every cell of the batch, run as a single executemany
+    version = next_table_version(db.session, 'heatmap')
+    connection = db.session.connection()
+    insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(HeatmapCell.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['zoom', 'x', 'y', 'month'],
+        set_={'count': HeatmapCell.__table__.c['count'] + statement.excluded['count'],
+              'version': statement.excluded.version})
+    connection.execute(statement, [{'zoom': zoom, 'x': x, 'y': y, 'month': month, 'count': count, 'version': version}
+                                   for (zoom, x, y, month), count in counts.items()])
+
+
+def rebuild_heatmap():
+    HeatmapCell.query.delete()
+    counts = {}
+    rows = db.session.query(Report.latitude, Report.longitude, Report.timestamp) \
+        .filter(Report.parent_id.is_(None)) \
+        .union_all(db.session.query(ArchivedReport.latitude, ArchivedReport.longitude, ArchivedReport.timestamp)
+                   .filter(ArchivedReport.parent_id.is_(None))) \
+        .execution_options(yield_per=1000)
+    for latitude, longitude, timestamp in rows:
+        for key in heatmap_keys(latitude, longitude, timestamp):
+            counts[key] = counts.get(key, 0) + 1
+    version = next_table_version(db.session, 'heatmap')
+    db.session.bulk_insert_mappings(HeatmapCell, [
+        {'zoom': zoom, 'x': x, 'y': y, 'month': month, 'count': count, 'version': version}
+        for (zoom, x, y, month), count in counts.items()])
+    db.session.commit()
+    return len(counts)
+
+
+# --- Archive ---
+# Resolved incidents whose last change is older than the cutoff move to
+# archived_report together with their sightings, a batch per transaction so
+# writers are only ever blocked for one short INSERT ... SELECT and DELETE.
+def archive_batch(cutoff, limit):
+    # The newest row stays: SQLite would hand its id out again once deleted
+    newest = db.session.query(func.max(Report.id)).scalar()
+    if newest is None:
+        return []
+    last_change = func.coalesce(Report.resolved_at, Report.updated_at, Report.timestamp)
+    ids = [report_id for (report_id,) in db.session.query(Report.id)
+           .filter(Report.status == 'Resolved', Report.timestamp < cutoff, last_change < cutoff,
+                   Report.parent_id.is_(None), Report.id < newest)
+           .order_by(Report.timestamp, Report.id).limit(limit)]
+    if not ids:
+        return []
+    moving = db.or_(Report.id.in_(ids), Report.parent_id.in_(ids))
+    moved = db.session.query(Report.id, Report.image_filename, Report.resolution_image).filter(moving).all()
+    names = [column.name for column in Report.__table__.columns]
+    db.session.execute(ArchivedReport.__table__.insert().from_select(
+        names, db.select(*[Report.__table__.c[name] for name in names]).where(moving)))
+    db.session.execute(Report.__table__.delete().where(moving))
+    # Listings change, so their ETags must too
+    next_report_version(db.session)
+    db.session.commit()
+    return moved
+
+
+# --- Geohash ---
+# Reports carry the geohash of their location so the map can cluster by
+# truncating it to a zoom-dependent prefix (longer prefix = smaller cell).
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION_BY_ZOOM = [1, 1, 2, 2, 3, 3, 3, 4, 4, 5, 5, 5, 6]
+
+
+def geohash_encode(latitude, longitude, precision=12):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+@db.event.listens_for(Report, 'before_insert')
+@db.event.listens_for(Report, 'before_update')
+def set_report_geohash(mapper, connection, report):
+    report.geohash = geohash_encode(float(report.latitude), float(report.longitude))
+
+
+class ClassificationCache(db.Model):
+    content_hash = db.Column(db.String(64), primary_key=True)
+    image_hash = db.Column(db.String(16), nullable=True, index=True)
+    labels = db.Column(db.Text, nullable=False, default='')
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class OutboundEmail(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(200), nullable=False)
+    sender = db.Column(db.String(120), nullable=True)
+    recipients = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    attachment = db.Column(db.String(100), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500), nullable=True)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+
+# --- Full-text Search ---
+# Descriptions and resolution notes are indexed with FTS5 on SQLite, as an
+# external-content table that triggers keep in step with report, and with a
+# GIN expression index on Postgres, which the database maintains itself.
+SEARCH_DOCUMENT = "coalesce(description, '') || ' ' || coalesce(resolution_notes, '')"
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS report_fts USING fts5("
+    "description, resolution_notes, content='report', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS report_fts_insert AFTER INSERT ON report BEGIN "
+    "INSERT INTO report_fts (rowid, description, resolution_notes) "
+    "VALUES (new.id, new.description, new.resolution_notes); END",
+    "CREATE TRIGGER IF NOT EXISTS report_fts_delete AFTER DELETE ON report BEGIN "
+    "INSERT INTO report_fts (report_fts, rowid, description, resolution_notes) "
+    "VALUES ('delete', old.id, old.description, old.resolution_notes); END",
+    "CREATE TRIGGER IF NOT EXISTS report_fts_update AFTER UPDATE OF description, resolution_notes ON report BEGIN "
+    "INSERT INTO report_fts (report_fts, rowid, description, resolution_notes) "
+    "VALUES ('delete', old.id, old.description, old.resolution_notes); "
+    "INSERT INTO report_fts (rowid, description, resolution_notes) "
+    "VALUES (new.id, new.description, new.resolution_notes); END",
+]
+POSTGRES_SEARCH_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_report_search ON report USING GIN (to_tsvector('english', {SEARCH_DOCUMENT}))",
+]
+
+
+def create_search_index(connection):
+    statements = POSTGRES_SEARCH_DDL if connection.dialect.name == 'postgresql' else SQLITE_SEARCH_DDL
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+@db.event.listens_for(Report.__table__, 'after_create')
+def create_search_index_with_table(target, connection, **kw):
+    create_search_index(connection)
@@ -0,0 +1,11 @@
+from models import create_app, db, ReportRollup, LatencyRollup, HeatmapCell, rebuild_rollups, rebuild_heatmap
+
+app = create_app()
+
+with app.app_context():
+    ReportRollup.__table__.create(db.engine, checkfirst=True)
+    LatencyRollup.__table__.create(db.engine, checkfirst=True)
+    HeatmapCell.__table__.create(db.engine, checkfirst=True)
+    report_rows, latency_rows = rebuild_rollups()
+    print(f"Rebuilt analytics rollups: {report_rows} report counters, {latency_rows} latency buckets")
+    print(f"Rebuilt heatmap aggregates: {rebuild_heatmap()} cells")
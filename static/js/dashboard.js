@@ -1,30 +1,38 @@
 document.addEventListener('DOMContentLoaded', function () {
-    const socket = io();
+    const socket = io(window.WARRN_SOCKET_OPTIONS);
     const tableBody = document.querySelector('table tbody');
 
     // Remove the "No reports found" row if it exists
     const noReportsRow = document.querySelector('#no-reports-row');
 
-    socket.on('new_report', function(report) {
+    function prependReportRow(report) {
+        if (tableBody.querySelector(`tr[data-report-id="${report.id}"]`)) {
+            return;
+        }
         if (noReportsRow) {
             noReportsRow.remove();
         }
 
         const newRow = document.createElement('tr');
+        newRow.dataset.reportId = report.id;
 
         const aiSuggestionBadge = report.ai_suggestion
             ? `<span class="badge bg-info text-dark">${report.ai_suggestion}</span>`
             : 'N/A';
+        const imageCell = report.medium_url
+            ? `<button class="btn btn-sm btn-info" onclick="showImage('${report.medium_url}')">👁️ View</button>`
+            : '<span class="text-muted">No image</span>';
 
         newRow.innerHTML = `
             <td>${report.id}</td>
             <td>${report.time}</td>
-            <td>${report.animal}</td>
-            <td>${aiSuggestionBadge}</td>
+            <td class="report-animal">${report.animal}</td>
+            <td class="ai-suggestion">${aiSuggestionBadge}</td>
             <td>${report.condition}</td>
-            <td><span class="badge bg-danger">${report.status}</span></td>
-            <td>Unclaimed</td>
-            <td>
+            <td>${imageCell}</td>
+            <td class="report-status"><span class="badge bg-danger">${report.status}</span></td>
+            <td class="report-responder">Unclaimed</td>
+            <td class="report-actions">
                 <form method="POST" style="display: inline;">
                     <button type="submit" formaction="${report.claim_url}" class="btn btn-primary btn-sm">Claim</button>
                 </form>
@@ -32,10 +40,36 @@ document.addEventListener('DOMContentLoaded', function () {
         `;
 
         tableBody.prepend(newRow);
+    }
 
+    // Drop rows that no longer match the page's filters, otherwise update them in place
+    function updateReportRow(update, badgeClass, actions) {
+        const row = tableBody.querySelector(`tr[data-report-id="${update.id}"]`);
+        if (!row) {
+            return;
+        }
+        if ((tableBody.dataset.status && tableBody.dataset.status !== update.status) ||
+                (tableBody.dataset.scope === 'unclaimed' && update.responder_id)) {
+            row.remove();
+            return;
+        }
+        row.querySelector('.report-status').innerHTML = `<span class="badge ${badgeClass}">${update.status}</span>`;
+        if (update.responder) {
+            row.querySelector('.report-responder').textContent = update.responder;
+        }
+        row.querySelector('.report-actions').innerHTML = actions;
+    }
+
+    function notifyNewReports(reports) {
+        if (reports.length === 0) {
+            return;
+        }
+        const body = reports.length === 1
+            ? `A ${reports[0].animal} needs help. Click to view dashboard.`
+            : `${reports.length} animals need help. Click to view dashboard.`;
         if (Notification.permission === "granted") {
             new Notification("New Incident Reported!", {
-                body: `A ${report.animal} needs help. Click to view dashboard.`,
+                body: body,
                 icon: "/static/favicon.ico" // Optional: Add an icon
             });
         } else if (Notification.permission !== "denied") {
@@ -45,5 +79,68 @@ document.addEventListener('DOMContentLoaded', function () {
                 }
             });
         }
+    }
+
+    const eventHandlers = {
+        new_report: function(report) {
+            // Only the first page of a view that lists new reports gets live rows
+            if (tableBody.dataset.live) {
+                prependReportRow(report);
+            }
+        },
+        // AI classification finishes after the report is saved
+        report_classified: function(update) {
+            const cell = tableBody.querySelector(`tr[data-report-id="${update.id}"] .ai-suggestion`);
+            if (cell) {
+                cell.innerHTML = `<span class="badge bg-info text-dark">${update.ai_suggestion}</span>`;
+            }
+        },
+        report_claimed: function(update) {
+            const actions = String(update.responder_id) === tableBody.dataset.userId
+                ? `<a href="${update.resolve_url}" class="btn btn-success btn-sm">✔️ Resolve</a>`
+                : '<span class="text-muted">-</span>';
+            updateReportRow(update, 'bg-warning text-dark', actions);
+        },
+        report_resolved: function(update) {
+            updateReportRow(update, 'bg-success', '<span class="text-muted">-</span>');
+        },
+        // Another report of the same incident was linked to it
+        report_sighting: function(update) {
+            const cell = tableBody.querySelector(`tr[data-report-id="${update.id}"] .report-animal`);
+            if (!cell) {
+                return;
+            }
+            let badge = cell.querySelector('.report-sightings');
+            if (!badge) {
+                badge = document.createElement('span');
+                badge.className = 'badge bg-secondary report-sightings';
+                badge.title = 'Follow-up reports of this incident';
+                cell.append(' ', badge);
+            }
+            badge.textContent = `+${update.sightings} sightings`;
+        }
+    };
+
+    // Events arrive coalesced: one report_batch message per burst
+    socket.on('report_batch', function(events) {
+        events.forEach(e => eventHandlers[e.event] && eventHandlers[e.event](e.data));
+        notifyNewReports(events.filter(e => e.event === 'new_report').map(e => e.data));
+    });
+
+    // Events sent while the socket was down are lost: after a reconnect, ask
+    // the ?since= feed whether any report changed since the page was built
+    let connectedBefore = false;
+    socket.on('connect', function() {
+        if (!connectedBefore) {
+            connectedBefore = true;
+            return;
+        }
+        fetch(`/api/reports?since=${tableBody.dataset.since}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.reports.length > 0) {
+                    window.location.reload();
+                }
+            });
     });
 });
\ No newline at end of file
@@ -7,37 +7,135 @@ document.addEventListener('DOMContentLoaded', function () {
     const redIcon = new L.Icon({ iconUrl: 'https://raw.githubusercontent.com/pointhi/leaflet-color-markers/master/img/marker-icon-2x-red.png', shadowUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/0.7.7/images/marker-shadow.png', iconSize: [25, 41], iconAnchor: [12, 41], popupAnchor: [1, -34], shadowSize: [41, 41] });
 
     const reportMarkers = L.layerGroup().addTo(map);
+    const markersById = {};
+    let clustered = true;
+    let since = null;
 
-    function addMarkerToMap(report) {
-        const marker = L.marker([report.lat, report.lon], { icon: redIcon }).addTo(reportMarkers);
-
+    function popupFor(report) {
         let popupContent = `<b>Status:</b> ${report.status}<br><b>Reported as:</b> ${report.animal}`;
         if (report.ai_suggestion) {
             popupContent += `<br><b>AI Suggestion:</b> ${report.ai_suggestion}`;
         }
         popupContent += `<br><b>Time:</b> ${report.time}`;
+        if (report.sightings) {
+            popupContent += `<br><b>Sightings:</b> ${report.sightings} more report(s) of this incident`;
+        }
         if (report.desc) {
             popupContent += `<br><b>Description:</b> ${report.desc}`;
         }
-        if (report.image_url) {
-            popupContent += `<br><img src="${report.image_url}" alt="Incident Image" style="width:150px;height:auto;margin-top:5px;">`;
+        if (report.thumb_url) {
+            popupContent += `<br><a href="${report.image_url}" target="_blank"><img src="${report.thumb_url}" alt="Incident Image" style="width:150px;height:auto;margin-top:5px;"></a>`;
         }
+        return popupContent;
+    }
 
-        marker.bindPopup(popupContent);
+    function addMarkerToMap(report) {
+        const marker = L.marker([report.lat, report.lon], { icon: redIcon }).addTo(reportMarkers);
+        marker.bindPopup(popupFor(report));
+        markersById[report.id] = { marker: marker, report: report };
     }
 
-    // Initial Load of existing reports
-    fetch('/api/reports')
-        .then(response => response.json())
-        .then(reports => {
-            reports.forEach(addMarkerToMap);
+    function addClusterToMap(cluster) {
+        const size = cluster.count < 10 ? 30 : cluster.count < 100 ? 38 : 46;
+        const icon = L.divIcon({
+            html: `<div>${cluster.count}</div>`,
+            className: 'report-cluster',
+            iconSize: [size, size]
         });
+        L.marker([cluster.lat, cluster.lon], { icon: icon })
+            .on('click', () => map.setView([cluster.lat, cluster.lon], map.getZoom() + 2))
+            .addTo(reportMarkers);
+    }
+
+    // Load only what is inside the current viewport; the server clusters
+    // reports at low zoom levels so the payload stays small.
+    function loadReports() {
+        const bounds = map.getBounds();
+        const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(',');
+        fetch(`/api/reports?bbox=${bbox}&zoom=${map.getZoom()}`)
+            .then(response => response.json())
+            .then(data => {
+                since = data.since;
+                reportMarkers.clearLayers();
+                Object.keys(markersById).forEach(id => delete markersById[id]);
+                clustered = data.clusters.length > 0 || data.reports.length === 0;
+                data.clusters.forEach(addClusterToMap);
+                data.reports.forEach(addMarkerToMap);
+            });
+    }
+
+    let reloadTimer = null;
+    function scheduleReload() {
+        clearTimeout(reloadTimer);
+        reloadTimer = setTimeout(loadReports, 250);
+    }
+
+    map.on('moveend', scheduleReload);
+    loadReports();
+
+    // Real-Time Updates with WebSockets. The server only sends events for
+    // the map tiles in view, coalesced into report_batch messages.
+    const socket = io(window.WARRN_SOCKET_OPTIONS);
+
+    function watchViewport() {
+        const bounds = map.getBounds();
+        socket.emit('watch_map', { bbox: [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()] });
+    }
+
+    // Events sent while the socket was down are lost; the ?since= feed
+    // replays every report change after the last map or feed response
+    function catchUp() {
+        if (since === null) {
+            return;
+        }
+        fetch(`/api/reports?since=${since}`)
+            .then(response => response.json())
+            .then(data => {
+                since = data.cursor;
+                data.reports.forEach(report => {
+                    if (markersById[report.id]) {
+                        updateMarker(report);
+                    } else {
+                        eventHandlers.new_report(report);
+                    }
+                });
+                if (data.has_more) {
+                    catchUp();
+                }
+            });
+    }
+
+    socket.on('connect', function() {
+        watchViewport();
+        catchUp();
+    });
+    map.on('moveend', watchViewport);
+
+    function updateMarker(update) {
+        const entry = markersById[update.id];
+        if (entry) {
+            Object.assign(entry.report, update);
+            entry.marker.setPopupContent(popupFor(entry.report));
+        }
+    }
 
-    // Real-Time Updates with WebSockets
-    const socket = io();
-    socket.on('new_report', function(report) {
-        addMarkerToMap(report);
-        map.panTo([report.lat, report.lon]);
+    const eventHandlers = {
+        new_report: function(report) {
+            if (clustered) {
+                scheduleReload();
+            } else if (map.getBounds().contains([report.lat, report.lon]) && !markersById[report.id]) {
+                addMarkerToMap(report);
+            }
+        },
+        // AI classification finishes after the report is saved
+        report_classified: updateMarker,
+        report_claimed: update => updateMarker({ id: update.id, status: update.status }),
+        report_resolved: update => updateMarker({ id: update.id, status: update.status }),
+        report_sighting: updateMarker
+    };
+
+    socket.on('report_batch', function(events) {
+        events.forEach(e => eventHandlers[e.event] && eventHandlers[e.event](e.data));
     });
 
     // Form Handling for New Reports
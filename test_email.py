@@ -1,6 +1,9 @@
 import os
-from app import app, mail
-from flask_mail import Message
+from flask_mail import Mail, Message
+from models import create_app
+
+app = create_app()
+mail = Mail(app)
 
 print("=" * 60)
 print("🧪 WARRN Email Configuration Test")
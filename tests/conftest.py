@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import time
+import tempfile
+
+import pytest
+
+# The app reads its configuration when it is imported, so the environment is
+# set before any test module imports it. 'local://' gives the app's Socket.IO
+# server the same relay manager a message queue would in production.
+WORKDIR = tempfile.TemporaryDirectory(prefix='warrn-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR.name, 'test.db')
+os.environ['UPLOAD_FOLDER'] = WORKDIR.name
+os.environ['SOCKETIO_MESSAGE_QUEUE'] = 'local://'
+os.environ['SOCKETIO_COALESCE_WINDOW'] = '0'
+os.environ['CLASSIFIER_BACKEND'] = 'stub'
+os.environ.pop('MAIL_USERNAME', None)
+os.environ.pop('MAIL_PASSWORD', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as warrn_app  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    with warrn_app.app.app_context():
+        warrn_app.db.engine.dispose()
+    WORKDIR.cleanup()
+
+
+@pytest.fixture(scope='session')
+def warrn():
+    with warrn_app.app.app_context():
+        warrn_app.db.create_all()
+    return warrn_app
+
+
+@pytest.fixture
+def client(warrn):
+    return warrn.app.test_client()
+
+
+@pytest.fixture
+def submit_report(client):
+    def submit(latitude, longitude, animal_type='Dog', **fields):
+        data = {'latitude': str(latitude), 'longitude': str(longitude), 'animal_type': animal_type,
+                'condition': 'Injured', 'description': '', 'reporter_email': 'reporter@example.com'}
+        data.update(fields)
+        return client.post('/report', data=data, content_type='multipart/form-data')
+    return submit
+
+
+@pytest.fixture
+def fake_socket(monkeypatch):
+    # A socket connected without a transport: the Socket.IO packets the
+    # server sends it are collected as decoded [event, data] lists
+    connected = []
+
+    def connect(server, eio_sid, rooms):
+        received = []
+        sid = server.manager.connect(eio_sid, '/')
+        for room in rooms:
+            server.manager.basic_enter_room(sid, '/', room)
+        connected.append((server, sid))
+        send_packet = server.eio.send_packet
+
+        def capture(to, packet):
+            if to == eio_sid:
+                # Event packets are '2' followed by the JSON [event, data]
+                if packet.data.startswith('2['):
+                    received.append(json.loads(packet.data[1:]))
+            else:
+                send_packet(to, packet)
+
+        monkeypatch.setattr(server.eio, 'send_packet', capture)
+        return received
+
+    yield connect
+    for server, sid in connected:
+        server.manager.disconnect(sid, '/')
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
@@ -0,0 +1,60 @@
+import pytest
+import socketio
+
+from conftest import wait_for
+
+
+@pytest.fixture(scope='module')
+def relay(warrn):
+    # Normally started by the first Engine.IO connection to each server
+    server = warrn.socketio.server
+    if not getattr(server.manager, 'thread', None):
+        server.manager.initialize()
+    return server
+
+
+@pytest.fixture(scope='module')
+def other_worker(warrn, relay):
+    # A second Socket.IO server on the same local:// channel stands in for
+    # another gunicorn worker, with its own coalescer
+    manager = warrn.relay_manager_class('local://')('local://', channel=warrn.app.config['SOCKETIO_CHANNEL'])
+    server = socketio.Server(client_manager=manager, async_mode='threading')
+    warrn.EventCoalescer(warrn.app, server)
+    server.manager.initialize()
+    return server
+
+
+def batches(received):
+    return [data for event, data in received if event == 'report_batch']
+
+
+def test_events_reach_sockets_on_every_worker(warrn, relay, other_worker, fake_socket, submit_report):
+    here = fake_socket(relay, 'eio-here', ['role_admin'])
+    there = fake_socket(other_worker, 'eio-there', ['role_admin'])
+    assert submit_report(20.0, 20.0).status_code == 302
+    assert wait_for(lambda: batches(here) and batches(there))
+    for received in (here, there):
+        [batch] = batches(received)
+        assert [item['event'] for item in batch] == ['new_report']
+        assert (batch[0]['data']['lat'], batch[0]['data']['lon']) == (20.0, 20.0)
+
+
+def test_socket_gets_one_batch_for_all_of_its_rooms(warrn, relay, fake_socket):
+    both = fake_socket(relay, 'eio-both', ['tile_a', 'tile_b'])
+    one = fake_socket(relay, 'eio-one', ['tile_b'])
+    warrn.event_coalescer.publish_many([('new_report', {'id': 9001}, ['tile_a']),
+                                        ('new_report', {'id': 9002}, ['tile_b', 'tile_a'])])
+    assert wait_for(lambda: batches(both) and batches(one))
+    assert [[item['data']['id'] for item in batch] for batch in batches(both)] == [[9001, 9002]]
+    assert [[item['data']['id'] for item in batch] for batch in batches(one)] == [[9002]]
+
+
+def test_newer_event_for_a_report_replaces_the_older_one(warrn, relay, fake_socket, monkeypatch):
+    monkeypatch.setitem(warrn.app.config, 'SOCKETIO_COALESCE_WINDOW', 0.3)
+    received = fake_socket(relay, 'eio-window', ['role_admin'])
+    warrn.event_coalescer.publish('report_claimed', {'id': 9100, 'version': 1}, ['role_admin'])
+    warrn.event_coalescer.publish('report_claimed', {'id': 9100, 'version': 2}, ['role_admin'])
+    warrn.event_coalescer.publish('report_resolved', {'id': 9100, 'version': 3}, ['role_admin'])
+    assert wait_for(lambda: batches(received))
+    assert batches(received) == [[{'event': 'report_claimed', 'data': {'id': 9100, 'version': 2}},
+                                  {'event': 'report_resolved', 'data': {'id': 9100, 'version': 3}}]]
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from models import Report
+
+
+def latest_reports(warrn, count):
+    with warrn.app.app_context():
+        return [(report.id, report.parent_id, report.sighting_count, report.status)
+                for report in Report.query.order_by(Report.id.desc()).limit(count)][::-1]
+
+
+def test_nearby_report_of_the_same_animal_becomes_a_sighting(warrn, submit_report):
+    submit_report(30.0, 30.0, 'Dog')
+    submit_report(30.0003, 30.0002, 'Dog')
+    submit_report(30.0003, 30.0002, 'Cat')
+    submit_report(30.5, 30.0, 'Dog')
+    (incident, _, sightings, _), sighting, cat, far = latest_reports(warrn, 4)
+    assert sightings == 1
+    assert sighting[1:] == (incident, 0, 'Sighting')
+    assert cat[1] is None and far[1] is None
+
+
+def test_list_cursor_pages_through_equal_timestamps(warrn, client, submit_report):
+    for i in range(7):
+        submit_report(40.0 + i, 40.0)
+    with warrn.app.app_context():
+        ids = [report_id for report_id, *_ in latest_reports(warrn, 7)]
+        Report.query.filter(Report.id.in_(ids)).update({'timestamp': datetime(2001, 1, 1)})
+        warrn.db.session.commit()
+        expected = [report.id for report in Report.query.filter(Report.parent_id.is_(None))
+                    .order_by(Report.timestamp.desc(), Report.id.desc())]
+
+    seen, cursor = [], None
+    while True:
+        page = client.get('/api/reports', query_string={'limit': 3, 'cursor': cursor or ''}).get_json()
+        seen += [report['id'] for report in page['reports']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_change_feed_follows_its_cursor(warrn, client, submit_report, monkeypatch):
+    submit_report(45.0, 45.0)
+    since = client.get('/api/reports', query_string={'limit': 1}).get_json()['since']
+    assert client.get('/api/reports', query_string={'since': since}).get_json()['reports'] == []
+
+    for i in range(5):
+        submit_report(46.0 + i, 45.0)
+    new_ids = [report_id for report_id, *_ in latest_reports(warrn, 5)]
+    monkeypatch.setitem(warrn.app.config, 'REPORTS_MAX_PAGE_SIZE', 2)
+    seen, has_more = [], True
+    while has_more:
+        page = client.get('/api/reports', query_string={'since': since}).get_json()
+        seen += [report['id'] for report in page['reports']]
+        since, has_more = page['cursor'], page['has_more']
+    assert seen == new_ids
+    assert client.get('/api/reports', query_string={'since': since}).get_json()['reports'] == []
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+import models
+from models import Report, ReportRollup, LatencyRollup
+
+
+def rollup_counts(warrn):
+    counts = {}
+    for model, keys in ((ReportRollup, ('day', 'status', 'animal_type', 'condition')),
+                        (LatencyRollup, ('day', 'metric', 'bucket'))):
+        for row in model.query:
+            if row.count:
+                counts[(model.__name__,) + tuple(getattr(row, key) for key in keys)] = row.count
+    return counts
+
+
+def assert_matches_rebuild(warrn):
+    # The edit has to leave the rollups as a rebuild from the reports would
+    incremental = rollup_counts(warrn)
+    models.rebuild_rollups()
+    assert rollup_counts(warrn) == incremental
+
+
+def report_admin(warrn):
+    return warrn.ReportAdmin(Report, warrn.db.session, endpoint='report_rollup_test')
+
+
+def test_admin_edit_moves_the_report_between_rollups(warrn, submit_report):
+    with warrn.app.app_context():
+        models.rebuild_rollups()
+    submit_report(50.0, 50.0, 'Dog')
+    with warrn.app.app_context():
+        report = Report.query.order_by(Report.id.desc()).first()
+        report.animal_type = 'Cat'
+        report.condition = 'Sick'
+        report.timestamp = report.timestamp - timedelta(days=3)
+        report.status = 'Resolved'
+        report.claimed_at = report.timestamp + timedelta(hours=1)
+        report.resolved_at = datetime.utcnow()
+        report_admin(warrn).on_model_change(None, report, False)
+        warrn.db.session.commit()
+        assert_matches_rebuild(warrn)
+
+
+def test_admin_delete_counts_the_orphaned_sightings(warrn, submit_report):
+    with warrn.app.app_context():
+        models.rebuild_rollups()
+    submit_report(55.0, 55.0, 'Dog')
+    submit_report(55.0001, 55.0, 'Dog')
+    with warrn.app.app_context():
+        incident = Report.query.filter(Report.latitude == 55.0).one()
+        assert incident.sighting_count == 1
+        report_admin(warrn).on_model_delete(incident)
+        warrn.db.session.delete(incident)
+        warrn.db.session.commit()
+        assert_matches_rebuild(warrn)
+        assert Report.query.filter(Report.latitude == 55.0001).one().parent_id is None